@@ -2,7 +2,7 @@ from fastapi import APIRouter, UploadFile, File, HTTPException
 from app.Acoustic_Signals.schemas.schema import GenerationInput, GeneratedSignal
 from app.Acoustic_Signals.services.generate_signal import generate_signal
 from app.Acoustic_Signals.services.extract_coef import extract_coef
-from app.Acoustic_Signals.services.get_prediction import get_prediction
+from app.Acoustic_Signals.services.get_prediction import WINDOW_SEC, get_prediction
 
 acoustic_router = APIRouter()
 
@@ -31,11 +31,13 @@ def ExtractCoef(file: UploadFile = File(...)):
     return extract_coef(file)
 
 
-# 3 - Endpoint for the AI models (Unchanged structure)
+# 3 - Endpoint for the AI models
 @acoustic_router.post("/submarine_detection")
-async def GetPrediction(file: UploadFile = File(...)):
+def GetPrediction(file: UploadFile = File(...), long_recording: bool = False, hop_sec: float = WINDOW_SEC):
     """
-    Kept as async def per instructions. 
-    Removed 'await' if get_prediction returns a non-awaitable object.
+    Plain 'def' like ExtractCoef: decoding and inference are CPU-heavy, so FastAPI runs
+    them in its threadpool instead of blocking the event loop.
+    long_recording=true classifies the whole file in 4 s windows, hop_sec apart
+    (at least 0.5 s), and adds the per-window timeline to the response.
     """
-    return get_prediction(file)
\ No newline at end of file
+    return get_prediction(file, long_recording, hop_sec)
\ No newline at end of file
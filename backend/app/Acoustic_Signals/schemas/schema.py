@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel, Field
 
 class GenerationInput(BaseModel):
@@ -16,10 +18,21 @@ class Coef(BaseModel):
     frequency : float 
     signal : list
 
+class DetectionTimeline(BaseModel):
+    window_sec : float
+    hop_sec : float
+    start_times : List[float]
+    ml_prediction : List[float]
+    dl_prediction : List[float]
+    mixed_approach : List[float]
+    detected : List[bool]
+    detected_fraction : float
+
 class AiPrediction(BaseModel):
     signal : list 
     ml_prediction : float
     dl_prediction : float 
     mixed_approach : float
     label : str
+    timeline : Optional[DetectionTimeline] = None
 
@@ -0,0 +1,87 @@
+from functools import lru_cache
+
+import librosa
+import numpy as np
+from scipy.fft import dct
+
+N_FFT = 2048            # librosa defaults the models were trained with
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 13
+ROLL_PERCENT = 0.85
+TOP_DB = 80.0           # librosa.power_to_db default
+
+
+@lru_cache(maxsize=8)
+def mel_filterbank(sr, n_fft=N_FFT, n_mels=N_MELS):
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+
+
+@lru_cache(maxsize=8)
+def dct_matrix(n_mfcc=N_MFCC, n_mels=N_MELS):
+    """Orthonormal type-II DCT as an (n_mfcc, n_mels) matrix, the transform librosa.feature.mfcc applies."""
+    return dct(np.eye(n_mels), type=2, norm="ortho", axis=0)[:n_mfcc].astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def fft_frequencies(sr, n_fft=N_FFT):
+    return librosa.fft_frequencies(sr=sr, n_fft=n_fft)[:, np.newaxis]
+
+
+def power_to_db(spec, relative=False):
+    """
+    librosa.power_to_db for a batch of (..., F, T) spectrograms, each clipped TOP_DB below
+    its own peak (librosa clips against the peak of the whole array). relative=True is ref=np.max.
+    """
+    spec_db = 10.0 * np.log10(np.maximum(spec, 1e-10))
+    if relative:
+        spec_db -= 10.0 * np.log10(np.maximum(spec.max(axis=(-2, -1), keepdims=True), 1e-10))
+    return np.maximum(spec_db, spec_db.max(axis=(-2, -1), keepdims=True) - TOP_DB)
+
+
+class AcousticFeatures:
+    """
+    Both ensemble inputs from one STFT of a batch of (N, n) windows. The magnitude
+    spectrogram feeds the centroid and rolloff, its square the mel spectrogram, which
+    gives the CNN input and, through the cached DCT, the MFCCs.
+    """
+
+    def __init__(self, y, sr):
+        self.y = np.asarray(y, dtype=np.float32)
+        self.sr = sr
+        self.magnitude = np.abs(librosa.stft(self.y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+        self.mel = np.einsum("...ft,mf->...mt", self.magnitude ** 2, mel_filterbank(sr), optimize=True)
+
+    def spectrogram(self):
+        """(N, 1, 128, T) mel spectrograms, each in dB against its own peak and scaled to [0, 1]."""
+        spec_db = power_to_db(self.mel, relative=True)
+        low = spec_db.min(axis=(-2, -1), keepdims=True)
+        high = spec_db.max(axis=(-2, -1), keepdims=True)
+        spec_db = (spec_db - low) / (high - low + 1e-6)
+        # Reshape to (Batch, Channel, Height, Width) for ONNX
+        return spec_db.astype(np.float32)[:, np.newaxis, :, :]
+
+    def mfcc(self):
+        return np.einsum("cm,...mt->...ct", dct_matrix(), power_to_db(self.mel), optimize=True)
+
+    def spectral_centroid(self):
+        total = self.magnitude.sum(axis=-2, keepdims=True)
+        # silent frames are left unnormalised by librosa, so their centroid is 0
+        weights = self.magnitude / np.where(total >= np.finfo(total.dtype).tiny, total, 1.0)
+        return np.sum(fft_frequencies(self.sr) * weights, axis=-2, keepdims=True)
+
+    def spectral_rolloff(self):
+        energy = np.cumsum(self.magnitude, axis=-2)
+        threshold = ROLL_PERCENT * energy[..., -1:, :]
+        reached = np.where(energy < threshold, np.nan, 1.0)
+        return np.nanmin(reached * fft_frequencies(self.sr), axis=-2, keepdims=True)
+
+    def ml_features(self):
+        """(N, 16) rows: mean MFCCs, centroid, zero-crossing rate, rolloff."""
+        zcr = librosa.feature.zero_crossing_rate(self.y, frame_length=N_FFT, hop_length=HOP_LENGTH)
+        return np.concatenate([
+            np.mean(self.mfcc(), axis=-1),
+            np.mean(self.spectral_centroid(), axis=-1),
+            np.mean(zcr, axis=-1),
+            np.mean(self.spectral_rolloff(), axis=-1),
+        ], axis=-1)
@@ -0,0 +1,134 @@
+import hashlib
+import io
+import os
+import threading
+import wave
+from collections import OrderedDict
+from math import gcd
+
+import librosa
+import numpy as np
+from scipy.signal import resample_poly
+
+RESAMPLE_QUALITY = os.environ.get("ACOUSTIC_RESAMPLE_QUALITY", "fast")
+CACHE_BYTES = int(float(os.environ.get("ACOUSTIC_AUDIO_CACHE_MB", 256)) * 1024 * 1024)
+
+# PCM sample width -> (little-endian dtype, full scale)
+_PCM = {1: ("u1", 128.0), 2: ("<i2", 32768.0), 3: ("<i4", 2.0 ** 31), 4: ("<i4", 2.0 ** 31)}
+
+
+class AudioCache:
+    """
+    Decoded clips as (signal, rate) keyed by (content hash, target rate, quality), least
+    recently used dropped first once the signals together exceed max_bytes.
+    Signals are stored read-only.
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+            return entry
+
+    def put(self, key, signal, rate):
+        if signal.nbytes > self.max_bytes:
+            return
+        signal.flags.writeable = False
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[0].nbytes
+            self._items[key] = (signal, rate)
+            self.size += signal.nbytes
+            while self.size > self.max_bytes:
+                _, (dropped, _) = self._items.popitem(last=False)
+                self.size -= dropped.nbytes
+
+
+audio_cache = AudioCache()
+
+
+def _decode_pcm_wav(data):
+    """Integer PCM WAV bytes -> (mono float32, rate) with no decoder backend; None for other codings."""
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            n_channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width not in _PCM:
+        return None
+
+    dtype, scale = _PCM[width]
+    raw = np.frombuffer(frames, dtype=np.uint8)
+    if width == 3:
+        # 24-bit samples go in the top three bytes of an int32
+        padded = np.zeros((len(raw) // 3, 4), dtype=np.uint8)
+        padded[:, 1:] = raw[:len(padded) * 3].reshape(-1, 3)
+        raw = padded
+    samples = raw.view(dtype).astype(np.float32)
+    if width == 1:
+        samples -= 128.0
+    samples = samples.reshape(-1, n_channels) / np.float32(scale)
+    return (samples[:, 0] if n_channels == 1 else samples.mean(axis=1)), rate
+
+
+def decode(data):
+    """Audio bytes -> (mono float32, native rate): PCM WAV directly, anything else through librosa."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        decoded = _decode_pcm_wav(data)
+        if decoded is not None:
+            return decoded
+    signal, rate = librosa.load(io.BytesIO(data), sr=None, mono=True)
+    return signal, rate
+
+
+def resample(signal, orig_sr, target_sr, quality=RESAMPLE_QUALITY):
+    """
+    quality "fast" is a polyphase FIR (scipy resample_poly); anything else is passed
+    to librosa as its res_type ("soxr_hq" is what librosa.load used to apply).
+    """
+    if orig_sr == target_sr:
+        return signal
+    if quality == "fast":
+        g = gcd(int(orig_sr), int(target_sr))
+        return resample_poly(signal, int(target_sr) // g, int(orig_sr) // g).astype(np.float32)
+    return librosa.resample(signal, orig_sr=orig_sr, target_sr=target_sr, res_type=quality).astype(np.float32)
+
+
+def load_audio(audio_file, sr=None, quality=RESAMPLE_QUALITY, cache=audio_cache):
+    """
+    Drop-in for librosa.load(audio_file, sr=sr, mono=True) on an uploaded file object.
+    The clip is looked up by the hash of its bytes, so the same upload sent again, or to
+    another endpoint, skips decoding; a cached native decode is only resampled.
+    The returned array is shared with the cache and read-only.
+    """
+    audio_file.seek(0)
+    data = audio_file.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    native_key = (digest, None, None)
+    key = native_key if sr is None else (digest, sr, quality)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    entry = cache.get(native_key)
+    if entry is None:
+        signal, rate = decode(data)
+        entry = (np.ascontiguousarray(signal, dtype=np.float32), rate)
+        cache.put(native_key, *entry)
+    native, rate = entry
+
+    if sr is None or sr == rate:
+        return native, rate
+    signal = np.ascontiguousarray(resample(native, rate, sr, quality), dtype=np.float32)
+    cache.put(key, signal, sr)
+    return signal, sr
@@ -1,8 +1,8 @@
 import numpy as np
-import librosa as lb
 import scipy.signal as signal
 from fastapi import UploadFile, File, HTTPException, status
 from app.Acoustic_Signals.schemas.schema import Coef
+from app.Acoustic_Signals.services.audio_loader import load_audio
 
 def extract_coef(file: UploadFile = File(...)):
     c = 343  # speed of sound (m/s)
@@ -11,8 +11,7 @@ def extract_coef(file: UploadFile = File(...)):
     if not (file_name.endswith(".mp3") or file_name.endswith(".wav")):
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE)
 
-    file.file.seek(0)
-    sig_arr, sr = lb.load(file.file, sr=None, mono=True)
+    sig_arr, sr = load_audio(file.file, sr=None)
 
     # STFT
     f, t, Zxx = signal.stft(sig_arr, fs=sr, nperseg=2048)
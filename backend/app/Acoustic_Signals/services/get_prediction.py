@@ -1,14 +1,22 @@
 from fastapi import UploadFile, File, HTTPException, status
-from app.Acoustic_Signals.schemas.schema import AiPrediction
+from app.Acoustic_Signals.schemas.schema import AiPrediction, DetectionTimeline
+from app.Acoustic_Signals.services.audio_features import AcousticFeatures
+from app.Acoustic_Signals.services.audio_loader import load_audio
 import onnxruntime as ort
 import joblib
-import librosa
 import numpy as np
 import os
 import warnings
 
 warnings.filterwarnings("ignore")
 
+SAMPLE_RATE = 16000     # rate both models were trained on
+WINDOW_SEC = 4.0        # one model input
+ONNX_BATCH_SIZE = 64    # spectrograms per session.run call
+WINDOWS_PER_CHUNK = 64  # windows whose STFTs are held in memory at once (about 100 MB)
+MIN_HOP_SEC = 0.5       # at most 8 overlapping windows per sample
+THRESHOLD = 0.5
+
 class UnifiedSubmarineDetector:
     def __init__(self):
         # Determine paths relative to this file
@@ -18,59 +26,120 @@ class UnifiedSubmarineDetector:
         
         # 1. Load ONNX Session
         self.ort_session = ort.InferenceSession(onnx_path)
+        self.input_name = self.ort_session.get_inputs()[0].name
+        # A model exported with a fixed batch dimension is fed that many spectrograms per call
+        batch = self.ort_session.get_inputs()[0].shape[0]
+        self.fixed_batch = batch if isinstance(batch, int) and batch > 0 else None
         
         # 2. Load Machine Learning Model
         self.ml_model = joblib.load(ml_path)
         print("✅ Ensemble (ONNX + ML) ready.")
 
-    def _extract_ml_features(self, y, sr):
-        mfcc = np.mean(librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13).T, axis=0)
-        centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr).T, axis=0)
-        zcr = np.mean(librosa.feature.zero_crossing_rate(y).T, axis=0)
-        rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr).T, axis=0)
-        return np.hstack([mfcc, centroid, zcr, rolloff])
+    def _run_onnx(self, specs):
+        """(N, 1, 128, T) -> (N,) sigmoid probabilities, in as few session.run calls as the model allows."""
+        batch_size = self.fixed_batch or ONNX_BATCH_SIZE
+        logits = []
+        for first in range(0, len(specs), batch_size):
+            batch = specs[first:first + batch_size]
+            n = len(batch)
+            if self.fixed_batch and n < self.fixed_batch:
+                batch = np.concatenate([batch, np.zeros((self.fixed_batch - n,) + batch.shape[1:], dtype=np.float32)])
+            out = self.ort_session.run(None, {self.input_name: batch})[0]
+            logits.append(np.asarray(out).reshape(len(batch), -1)[:n, 0])
+        return 1 / (1 + np.exp(-np.concatenate(logits)))  # Sigmoid
 
-    def _extract_dl_spectrogram(self, y, sr):
-        spec = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=128)
-        spec_db = librosa.power_to_db(spec, ref=np.max)
-        spec_db = (spec_db - spec_db.min()) / (spec_db.max() - spec_db.min() + 1e-6)
-        # Reshape to (Batch, Channel, Height, Width) for ONNX
-        return spec_db.astype(np.float32)[np.newaxis, np.newaxis, :, :]
+    def predict_windows(self, windows, sr=SAMPLE_RATE):
+        """(N, n) windows -> (ml_probs, dl_probs, avg_probs), each (N,), from one pass of each model."""
+        features = AcousticFeatures(windows, sr)
+        dl_probs = self._run_onnx(features.spectrogram())
+        ml_probs = self.ml_model.predict_proba(features.ml_features())[:, 1]
+        return ml_probs, dl_probs, (dl_probs + ml_probs) / 2
 
     def predict(self, audio_file):
         # 1. Load audio
-        signal, sr = librosa.load(audio_file, sr=16000)
+        signal, sr = load_audio(audio_file, sr=SAMPLE_RATE)
         
         # Ensure 4s duration
-        max_len = 16000 * 4
+        max_len = int(SAMPLE_RATE * WINDOW_SEC)
         y = np.pad(signal, (0, max_len - len(signal))) if len(signal) < max_len else signal[:max_len]
 
-        # 2. DL Prediction (ONNX)
-        input_name = self.ort_session.get_inputs()[0].name
-        ort_outs = self.ort_session.run(None, {input_name: self._extract_dl_spectrogram(y, sr)})
-        logits = ort_outs[0][0][0]
-        dl_prob = 1 / (1 + np.exp(-logits)) # Sigmoid
-
-        # 3. ML Prediction (Random Forest)
-        ml_prob = self.ml_model.predict_proba([self._extract_ml_features(y, sr)])[0][1]
-
-        # 4. Ensemble
-        avg_prob = (dl_prob + ml_prob) / 2
-        label = "🚨 SUBMARINE" if avg_prob > 0.5 else "✅ NO SUBMARINE"
+        # 2. DL (ONNX) + ML (Random Forest) ensemble
+        ml_prob, dl_prob, avg_prob = (p[0] for p in self.predict_windows(y[np.newaxis, :], sr))
+        label = "🚨 SUBMARINE" if avg_prob > THRESHOLD else "✅ NO SUBMARINE"
         
         return signal, ml_prob, dl_prob, avg_prob, label
 
-def get_prediction(file: UploadFile = File(...)):
+    def predict_timeline(self, audio_file, hop_sec=WINDOW_SEC):
+        """
+        Every 4 s window of the whole recording, hop_sec apart (less than 4 s overlaps them);
+        the last window is zero-padded. Windows go through features and both models
+        WINDOWS_PER_CHUNK at a time, so memory does not grow with the recording length.
+        """
+        signal, sr = load_audio(audio_file, sr=SAMPLE_RATE)
+        size = int(SAMPLE_RATE * WINDOW_SEC)
+        hop = max(int(round(MIN_HOP_SEC * SAMPLE_RATE)), int(round(hop_sec * SAMPLE_RATE)))
+        n_windows = 1 + max(0, -(-(len(signal) - size) // hop))
+        padded = np.zeros((n_windows - 1) * hop + size, dtype=np.float32)
+        padded[:len(signal)] = signal
+        # A strided view: no window is copied until its chunk is processed
+        windows = np.lib.stride_tricks.sliding_window_view(padded, size)[::hop]
+
+        chunks = [
+            self.predict_windows(np.ascontiguousarray(windows[first:first + WINDOWS_PER_CHUNK]), sr)
+            for first in range(0, n_windows, WINDOWS_PER_CHUNK)
+        ]
+        ml_probs, dl_probs, avg_probs = (np.concatenate(probs) for probs in zip(*chunks))
+        return signal, np.arange(n_windows) * hop / SAMPLE_RATE, ml_probs, dl_probs, avg_probs
+
+
+# One detector per process; requests are refused while the models are missing
+try:
+    detector = UnifiedSubmarineDetector()
+except Exception as error:
+    detector = None
+    print(f"Failed to load submarine detector: {error}")
+
+
+def _percent(p):
+    return round(float(p) * 100, 2)
+
+
+def get_prediction(file: UploadFile = File(...), long_recording: bool = False, hop_sec: float = WINDOW_SEC):
     if not (file.filename.endswith(".mp3") or file.filename.endswith(".wav")):
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE)
+    if detector is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Submarine detector is not loaded")
 
-    detector = UnifiedSubmarineDetector()
-    signal, ml_p, dl_p, avg_p, label = detector.predict(file.file)
-    
+    if not long_recording:
+        signal, ml_p, dl_p, avg_p, label = detector.predict(file.file)
+        return AiPrediction(
+            signal=signal.tolist()[::10],              
+            ml_prediction=_percent(ml_p), 
+            dl_prediction=_percent(dl_p),
+            mixed_approach=_percent(avg_p),
+            label =  label
+        )
+
+    if hop_sec < MIN_HOP_SEC:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"hop_sec must be at least {MIN_HOP_SEC} s")
+    signal, starts, ml_p, dl_p, avg_p = detector.predict_timeline(file.file, hop_sec)
+    detected = avg_p > THRESHOLD
+    # File-level scores are those of the most confident window
+    best = int(np.argmax(avg_p))
     return AiPrediction(
-        signal=signal.tolist()[::10],              
-        ml_prediction=round(float(ml_p) * 100, 2), 
-        dl_prediction=round(float(dl_p) * 100, 2),
-        mixed_approach=round(float(avg_p) * 100, 2),
-        label =  label
-    )
\ No newline at end of file
+        signal=signal.tolist()[::10],
+        ml_prediction=_percent(ml_p[best]),
+        dl_prediction=_percent(dl_p[best]),
+        mixed_approach=_percent(avg_p[best]),
+        label="🚨 SUBMARINE" if detected.any() else "✅ NO SUBMARINE",
+        timeline=DetectionTimeline(
+            window_sec=WINDOW_SEC,
+            hop_sec=hop_sec,
+            start_times=np.round(starts, 3).tolist(),
+            ml_prediction=[_percent(p) for p in ml_p],
+            dl_prediction=[_percent(p) for p in dl_p],
+            mixed_approach=[_percent(p) for p in avg_p],
+            detected=detected.tolist(),
+            detected_fraction=round(float(detected.mean()), 4),
+        ),
+    )
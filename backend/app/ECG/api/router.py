@@ -1,22 +1,102 @@
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+import os
+import uuid
+from functools import partial
+from typing import List, Optional
 
-from app.ECG.schemas.schema import ECGResponse, PredictionResponse
+import numpy as np
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+
+from app.ECG.schemas.schema import BeatClassificationResponse, ECGResponse, PredictionResponse
+from app.ECG.services.cnn_inference import WINDOW_SIZE
+from app.ECG.services.live_stream import DISPLAY_RATE, LiveECGStream, MicroBatcher
+from app.ECG.services.record_readers import ECG_EXTENSIONS, is_supported, read_ecg_upload
+from app.EEG.services.session_store import SessionStore
 from app.ECG.services.service import (
+    ECG_SAMPLING_RATE,
+    HIGHPASS_HZ,
+    LOWPASS_HZ,
+    NOTCH_HZ,
+    classify_beats,
+    ecg_payload,
     is_pretrained_available,
-    parse_ecg,
     predict_ecg,
+    preprocess_ecg,
+    read_ecg_table,
+    window_probabilities,
 )
 
 router = APIRouter(prefix="/ecg")
 
+# Parsed uploads, reused by id: dropped after a day unused, or least recently used beyond 1 GB
+records = SessionStore(
+    "temp_ecg_records",
+    ttl_seconds=float(os.environ.get("ECG_RECORD_TTL_SECONDS", 24 * 3600)),
+    max_bytes=int(os.environ.get("ECG_RECORD_MAX_BYTES", 1024 ** 3)),
+)
+records.start_sweeper(float(os.environ.get("ECG_RECORD_SWEEP_SECONDS", 300)))
 
-@router.post("/upload", response_model=ECGResponse)
-async def upload_ecg(file: UploadFile = File(...)):
-    return await parse_ecg(file)
+# The upload's own time column, stored only when it is not implied by the rate
+TIME_FILE = "time.f64"
 
+# One micro-batcher per model, shared by every open stream of this worker
+stream_batchers = {
+    model: MicroBatcher(partial(window_probabilities, model_type=model))
+    for model in ("pretrained", "classical")
+}
 
-@router.post("/predict", response_model=PredictionResponse)
-async def predict(file: UploadFile = File(...), model: str = Form(...)):
+
+def _read_upload(file, data_files=None, channels=None, t_start=0.0, t_end=None, filters=None):
+    """
+    CSV, EDF/BDF or WFDB (.hea with its .dat in data_files, or a .zip) -> (channels, time,
+    signals, rate), with the signals already through the preprocessing filters.
+    """
+    if not is_supported(file.filename):
+        raise HTTPException(
+            status_code=406,
+            detail=f"Only {', '.join(ECG_EXTENSIONS)} ECG files allowed.",
+        )
+    uploads = [(file.filename, file.file)] + [(f.filename, f.file) for f in data_files or []]
+    try:
+        channels, time, signals, sampling_rate = read_ecg_upload(uploads, read_ecg_table, channels, t_start, t_end)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except Exception as error:
+        print(f"ECG parse error: {error}")
+        raise HTTPException(status_code=400, detail="Could not parse ECG file.")
+    return channels, time, preprocess_ecg(signals, sampling_rate, **(filters or {})), sampling_rate
+
+
+def _load_record(record_id):
+    # exists() also marks the record as recently used
+    try:
+        if not records.exists(record_id):
+            raise KeyError(record_id)
+        meta = records.load_meta(record_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="ECG record not found. Upload the file first.")
+    return meta, records.open_signals(record_id, meta)
+
+
+def _record_time(record_id, meta):
+    path = records.session_path(record_id, TIME_FILE)
+    if os.path.exists(path):
+        return np.fromfile(path, dtype="<f8")
+    return np.arange(meta["num_samples"]) / meta["sampling_rate"]
+
+
+def _record_signals(record_id, file):
+    """(channels, signals, sampling_rate) of a stored record, or of a file sent with the request."""
+    # A stored record costs only inference; a file is still accepted for one-off calls
+    if record_id:
+        meta, signals = _load_record(record_id)
+        return meta["channels"], signals, meta["sampling_rate"]
+    if file is not None:
+        channels, _, signals, sampling_rate = _read_upload(file)
+        return channels, signals, sampling_rate
+    raise HTTPException(status_code=400, detail="Send a record_id from /ecg/upload or a file.")
+
+
+def _check_model(model):
     model = (model or "pretrained").lower()
     if model not in {"pretrained", "classical"}:
         raise HTTPException(status_code=400, detail="Model must be 'pretrained' or 'classical'.")
@@ -26,7 +106,136 @@ async def predict(file: UploadFile = File(...), model: str = Form(...)):
             status_code=503,
             detail="Pretrained ECG model is unavailable (missing ONNX artifacts).",
         )
+    return model
 
-    data = await parse_ecg(file)
-    preds = await predict_ecg(data, model_type=model)
+
+@router.post("/upload", response_model=ECGResponse)
+async def upload_ecg(
+    file: UploadFile = File(...),
+    data_files: Optional[List[UploadFile]] = File(None),
+    channels: Optional[str] = Form(None),
+    t_start: float = Form(0.0),
+    t_end: Optional[float] = Form(None),
+    highpass: float = Form(HIGHPASS_HZ),
+    notch: float = Form(NOTCH_HZ),
+    lowpass: float = Form(LOWPASS_HZ),
+):
+    """
+    Accepts CSV, EDF/EDF+/BDF, or a WFDB record (the .hea as `file` with its .dat in
+    `data_files`, or both in one .zip). `channels` (comma-separated names) and
+    t_start / t_end (seconds) limit what is read and stored.
+    The record is stored filtered (high-pass, 50/60 Hz notch, optional low-pass; 0 turns a
+    stage off), so the viewer and every later prediction see the same signal.
+    """
+    requested = [name.strip() for name in channels.split(",") if name.strip()] if channels else None
+    if t_end is not None and t_end <= t_start:
+        raise HTTPException(status_code=400, detail="t_end must be greater than t_start.")
+    filters = {"highpass": highpass, "notch": notch, "lowpass": lowpass}
+    channels, time, signals, sampling_rate = _read_upload(file, data_files, requested, t_start, t_end, filters)
+    record_id = str(uuid.uuid4())
+    records.save(
+        record_id, signals, channels, sampling_rate,
+        extra_meta={"preprocessing": filters},
+        extra_files={TIME_FILE: np.asarray(time, dtype="<f8")} if time is not None else None,
+    )
+    return {"record_id": record_id, **ecg_payload(channels, time, signals, sampling_rate)}
+
+
+@router.get("/records/{record_id}", response_model=ECGResponse)
+async def get_record(record_id: str):
+    meta, signals = _load_record(record_id)
+    time = _record_time(record_id, meta)
+    return {"record_id": record_id, **ecg_payload(meta["channels"], time, signals, meta["sampling_rate"])}
+
+
+@router.post("/predict", response_model=PredictionResponse)
+def predict(
+    file: Optional[UploadFile] = File(None),
+    model: str = Form(...),
+    record_id: Optional[str] = Form(None),
+):
+    model = _check_model(model)
+    channels, signals, sampling_rate = _record_signals(record_id, file)
+    preds = predict_ecg(signals, channels, model_type=model, sampling_rate=sampling_rate)
     return preds
+
+
+@router.post("/beats", response_model=BeatClassificationResponse)
+def classify_record_beats(
+    file: Optional[UploadFile] = File(None),
+    model: str = Form("pretrained"),
+    record_id: Optional[str] = Form(None),
+    channel: Optional[str] = Form(None),
+):
+    model = _check_model(model)
+    channels, signals, sampling_rate = _record_signals(record_id, file)
+    if channel is not None and channel.lower() not in channels:
+        raise HTTPException(status_code=400, detail=f"Unknown channel '{channel}'.")
+
+    result = classify_beats(signals, channels, model, sampling_rate, channel.lower() if channel else None)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Classical ECG model is unavailable.")
+    return result
+
+
+@router.websocket("/stream")
+async def stream_ecg(websocket: WebSocket):
+    """
+    Live ECG: the first message is JSON {"channels": [...], "sampling_rate": 360,
+    "model": "pretrained"}; every following message is a chunk of samples (binary
+    little-endian float32 rows, or JSON {"samples": [[...], ...]}). Each chunk is answered
+    with its decimated display samples and the predictions of the windows it completed.
+    """
+    await websocket.accept()
+    try:
+        config = await websocket.receive_json()
+        model = _check_model(config.get("model"))
+        stream = LiveECGStream(
+            config["channels"],
+            float(config.get("sampling_rate", ECG_SAMPLING_RATE)),
+            stream_batchers[model],
+            display_rate=float(config.get("display_rate", DISPLAY_RATE)),
+            filters={
+                "highpass": float(config.get("highpass", HIGHPASS_HZ)),
+                "notch": float(config.get("notch", NOTCH_HZ)),
+                "lowpass": float(config.get("lowpass", LOWPASS_HZ)),
+            },
+        )
+    except WebSocketDisconnect:
+        return
+    except HTTPException as error:
+        await websocket.send_json({"type": "error", "detail": error.detail})
+        await websocket.close(code=1008)
+        return
+    except (KeyError, TypeError, ValueError) as error:
+        await websocket.send_json({"type": "error", "detail": f"Invalid stream configuration: {error}"})
+        await websocket.close(code=1008)
+        return
+
+    await websocket.send_json({
+        "type": "ready",
+        "model": model,
+        "channels": stream.channels,
+        "sampling_rate": stream.sampling_rate,
+        "window_size": WINDOW_SIZE,
+    })
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                block = stream.decode(message)
+            except (KeyError, TypeError, ValueError) as error:
+                # A bad chunk is reported and skipped; the stream stays open
+                await websocket.send_json({"type": "error", "detail": str(error)})
+                continue
+            try:
+                result = await stream.push(block)
+            except Exception as error:
+                print(f"ECG stream inference error: {error}")
+                await websocket.send_json({"type": "error", "detail": "Inference failed for this chunk."})
+                continue
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
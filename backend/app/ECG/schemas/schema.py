@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 
 class ECGResponse(BaseModel):
@@ -7,6 +7,7 @@ class ECGResponse(BaseModel):
     channels: List[str]
     signals: Dict[str, List[float]]
     num_samples: int
+    record_id: Optional[str] = None
 
 
 class PredictionScores(BaseModel):
@@ -17,5 +18,24 @@ class PredictionScores(BaseModel):
     RBBB: float
 
 
+class WindowPredictions(BaseModel):
+    window_size: int
+    start_times: List[float]
+    channels: Dict[str, Dict[str, List[float]]]
+
+
 class PredictionResponse(BaseModel):
     prediction: PredictionScores
+    windows: Optional[WindowPredictions] = None
+
+
+class BeatClassificationResponse(BaseModel):
+    model: str
+    channel: str
+    num_beats: int
+    heart_rate: Optional[float]
+    beat_times: List[float]
+    labels: List[str]
+    confidence: List[float]
+    counts: Dict[str, int]
+    prediction: PredictionScores  # share of beats per class
@@ -0,0 +1,69 @@
+from math import gcd
+
+import numpy as np
+from scipy.signal import butter, find_peaks, resample_poly, sosfiltfilt
+
+MODEL_RATE = 360        # the beat models were trained on 360 Hz records
+BEAT_SIZE = 200         # samples per beat, centred on the R peak
+QRS_BAND = (5.0, 15.0)  # where the QRS energy sits
+INTEGRATION_SEC = 0.15  # moving-window integration, about one QRS width
+THRESHOLD_BLOCK_SEC = 5.0
+THRESHOLD_RATIO = 0.3   # of the local 98th percentile of the integrated energy
+REFRACTORY_SEC = 0.25   # no two beats closer than this (240 bpm)
+SEARCH_SEC = 0.1        # R is the extreme of the QRS within +/- this of the energy peak
+
+
+def resample_to_model_rate(signal, sampling_rate):
+    if round(sampling_rate) == MODEL_RATE:
+        return np.asarray(signal, dtype=np.float64)
+    up, down = MODEL_RATE, int(round(sampling_rate))
+    g = gcd(up, down)
+    return resample_poly(np.asarray(signal, dtype=np.float64), up // g, down // g)
+
+
+def detect_r_peaks(signal, fs=MODEL_RATE):
+    """
+    Pan-Tompkins style R-peak detection over the whole lead at once:
+    band-pass -> derivative -> square -> moving-window integration -> adaptive threshold.
+    The threshold follows a per-block percentile of the energy, so it tracks amplitude
+    changes over long recordings. Returns sample indices of the R peaks.
+    """
+    x = np.nan_to_num(np.asarray(signal, dtype=np.float64))
+    n = len(x)
+    if n < int(fs):
+        return np.zeros(0, dtype=np.int64)
+    x = x - np.median(x)
+
+    sos = butter(2, QRS_BAND, btype="band", fs=fs, output="sos")
+    filtered = sosfiltfilt(sos, x)
+    energy = np.gradient(filtered) ** 2
+    width = max(1, int(round(INTEGRATION_SEC * fs)))
+    integrated = np.convolve(energy, np.ones(width) / width, mode="same")
+
+    # Adaptive threshold: block percentiles interpolated back to every sample
+    block = max(1, int(THRESHOLD_BLOCK_SEC * fs))
+    n_blocks = -(-n // block)
+    padded = np.full(n_blocks * block, np.nan)
+    padded[:n] = integrated
+    levels = np.nanpercentile(padded.reshape(n_blocks, block), 98, axis=1)
+    centers = np.minimum(np.arange(n_blocks) * block + block / 2, n - 1)
+    threshold = THRESHOLD_RATIO * np.interp(np.arange(n), centers, levels)
+    # Flat stretches must not turn noise into beats
+    threshold = np.maximum(threshold, 0.1 * THRESHOLD_RATIO * np.median(levels))
+
+    peaks, _ = find_peaks(integrated, height=threshold, distance=max(1, int(REFRACTORY_SEC * fs)))
+    if not len(peaks):
+        return peaks
+
+    # Snap each energy peak to the largest deflection of the QRS around it
+    half = int(SEARCH_SEC * fs)
+    idx = np.clip(peaks[:, np.newaxis] + np.arange(-half, half + 1), 0, n - 1)
+    r_peaks = idx[np.arange(len(idx)), np.argmax(np.abs(filtered[idx]), axis=1)]
+    return np.unique(r_peaks)
+
+
+def segment_beats(signal, r_peaks, size=BEAT_SIZE):
+    """(n_beats, size) beats centred on each R peak, gathered with one fancy index; edges are zero-padded."""
+    before = size // 2
+    padded = np.pad(np.asarray(signal, dtype=np.float32), (before, size - before))
+    return padded[np.asarray(r_peaks)[:, np.newaxis] + np.arange(size)]
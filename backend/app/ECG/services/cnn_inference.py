@@ -0,0 +1,105 @@
+import numpy as np
+from scipy.special import softmax
+
+WINDOW_SIZE = 200      # samples per CNN input
+BATCH_SIZE = 1024      # windows per session.run call
+CLASS_NAMES = ["Normal", "AFib", "PVC", "LBBB", "RBBB"]
+
+# Per-window layouts the exported CNN may expect, in the order they used to be tried
+_LAYOUTS = [(WINDOW_SIZE,), (1, WINDOW_SIZE), (WINDOW_SIZE, 1)]
+
+
+def resolve_input_layout(session):
+    """
+    Per-window input shape of the model and its fixed batch size (None when dynamic).
+    Read from the declared input shape; only a model with symbolic dimensions is probed,
+    once, with a zero batch.
+    """
+    model_input = session.get_inputs()[0]
+    shape = list(model_input.shape)
+    fixed_batch = shape[0] if shape and isinstance(shape[0], int) and shape[0] > 0 else None
+
+    candidates = [tail for tail in _LAYOUTS if len(tail) + 1 == len(shape)] or _LAYOUTS
+    declared = [tail for tail in candidates if all(isinstance(d, int) for d in shape[1:]) and tuple(shape[1:]) == tail]
+    if declared:
+        return declared[0], fixed_batch
+
+    for tail in candidates:
+        try:
+            session.run(None, {model_input.name: np.zeros((fixed_batch or 1,) + tail, dtype=np.float32)})
+            return tail, fixed_batch
+        except Exception:
+            continue
+    raise RuntimeError("ONNX model accepts none of the supported input shapes")
+
+
+def class_probabilities(outputs):
+    """
+    Raw model rows -> (n, 5) probabilities in CLASS_NAMES order. Rows that already look
+    like probabilities are renormalised, anything else (logits) goes through softmax.
+    """
+    values = np.asarray(outputs, dtype=np.float64).reshape(len(outputs), -1)
+    sums = values.sum(axis=1, keepdims=True)
+    is_prob = np.all((values >= 0) & (values <= 1), axis=1, keepdims=True) & np.isclose(sums, 1.0, atol=1e-2)
+    probs = np.where(is_prob, values / np.where(sums > 0, sums, 1.0), softmax(values, axis=1))
+
+    out = np.zeros((len(values), len(CLASS_NAMES)))
+    k = min(len(CLASS_NAMES), probs.shape[1])
+    out[:, :k] = probs[:, :k]
+    total = out.sum(axis=1, keepdims=True)
+    return np.divide(out, total, out=out, where=total > 0)
+
+
+def split_windows(signals, window=WINDOW_SIZE):
+    """(n, C) -> (C, n_windows, window) float32; the last window is zero-padded."""
+    signals = np.asarray(signals, dtype=np.float32)
+    n, n_channels = signals.shape
+    n_windows = max(1, -(-n // window))
+    padded = np.zeros((n_windows * window, n_channels), dtype=np.float32)
+    padded[:n] = signals
+    return np.ascontiguousarray(padded.reshape(n_windows, window, n_channels).transpose(2, 0, 1))
+
+
+class WindowClassifier:
+    """The ECG CNN with its input layout resolved once, run on many windows per call."""
+
+    def __init__(self, session, batch_size=BATCH_SIZE):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.layout, self.fixed_batch = resolve_input_layout(session)
+        self.batch_size = self.fixed_batch or batch_size
+
+    def predict_windows(self, windows):
+        """(n, 200) -> (n, 5) class probabilities."""
+        windows = np.asarray(windows, dtype=np.float32).reshape(-1, WINDOW_SIZE)
+        rows = []
+        for first in range(0, len(windows), self.batch_size):
+            batch = windows[first:first + self.batch_size]
+            n = len(batch)
+            if self.fixed_batch and n < self.fixed_batch:
+                batch = np.concatenate([batch, np.zeros((self.fixed_batch - n, WINDOW_SIZE), dtype=np.float32)])
+            raw = self.session.run(None, {self.input_name: batch.reshape((len(batch),) + self.layout)})[0]
+            rows.append(np.asarray(raw).reshape(len(batch), -1)[:n])
+        return class_probabilities(np.concatenate(rows))
+
+    def predict_record(self, signals):
+        """(n, C) -> (C, n_windows, 5) probabilities of every 200-sample window of every channel."""
+        windows = split_windows(signals)
+        n_channels, n_windows = windows.shape[:2]
+        return self.predict_windows(windows.reshape(-1, WINDOW_SIZE)).reshape(n_channels, n_windows, -1)
+
+
+def aggregate_windows(probs, channels, sampling_rate, window=WINDOW_SIZE):
+    """Record-level prediction (mean over all windows and channels) plus the per-window detail."""
+    mean = probs.reshape(-1, probs.shape[-1]).mean(axis=0)
+    return {
+        "prediction": dict(zip(CLASS_NAMES, mean.tolist())),
+        "windows": {
+            "window_size": window,
+            "start_times": (np.arange(probs.shape[1]) * window / sampling_rate).tolist(),
+            "channels": {
+                channel: {name: np.round(probs[i, :, k], 4).tolist() for k, name in enumerate(CLASS_NAMES)}
+                for i, channel in enumerate(channels)
+            },
+        },
+    }
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+
+from app.ECG.services.cnn_inference import CLASS_NAMES, WINDOW_SIZE
+from app.ECG.services.service import design_preprocessing
+
+MAX_CHUNK_SEC = 5.0       # larger chunks are refused so one message cannot stall the stream
+DISPLAY_RATE = 100.0      # decimated samples per second pushed back for the monitor trace
+ROLLING_WINDOWS = 10      # windows averaged into the rolling prediction
+BATCH_MAX_WINDOWS = 512   # windows per model call, summed over all connections
+BATCH_MAX_DELAY = 0.01    # seconds a window may wait for others to fill the batch
+
+
+class RingBuffer:
+    """Fixed-capacity (capacity, n_channels) float32 buffer; the oldest samples are overwritten."""
+
+    def __init__(self, capacity, n_channels):
+        self.data = np.zeros((capacity, n_channels), dtype=np.float32)
+        self.capacity = capacity
+        self.total = 0  # samples ever written
+
+    def extend(self, block):
+        written = len(block)
+        block = block[-self.capacity:]
+        n = len(block)
+        start = (self.total + written - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = block[:first]
+        self.data[:n - first] = block[first:]
+        self.total += written
+
+    def read(self, start, stop):
+        """Samples [start, stop) by absolute index; they must still be in the buffer."""
+        if start < self.total - self.capacity or stop > self.total:
+            raise IndexError("Requested samples are no longer buffered")
+        idx = np.arange(start, stop) % self.capacity
+        return self.data[idx]
+
+
+class MicroBatcher:
+    """
+    Collects windows from every open stream and classifies them together: a batch is run
+    as soon as it holds max_windows, or max_delay after its first window arrived. The model
+    runs in the default thread pool so the event loop keeps serving other connections.
+    """
+
+    def __init__(self, predict, max_windows=BATCH_MAX_WINDOWS, max_delay=BATCH_MAX_DELAY):
+        self.predict = predict
+        self.max_windows = max_windows
+        self.max_delay = max_delay
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, windows):
+        """(n, 200) -> (n, 5) probabilities."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((windows, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            size = len(items[0][0])
+            deadline = loop.time() + self.max_delay
+            while size < self.max_windows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            try:
+                batch = np.concatenate([windows for windows, _ in items])
+                probs = await loop.run_in_executor(None, self.predict, batch)
+            except Exception as error:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            first = 0
+            for windows, future in items:
+                if not future.done():
+                    future.set_result(probs[first:first + len(windows)])
+                first += len(windows)
+
+
+class LiveECGStream:
+    """
+    State of one streaming connection. Samples go through the same preprocessing cascade
+    as uploads, run causally with its state carried across chunks; the filtered samples
+    feed a ring buffer from which every completed 200-sample window is cut for the model,
+    and the decimated display trace.
+    """
+
+    def __init__(self, channels, sampling_rate, batcher, display_rate=DISPLAY_RATE, filters=None):
+        if not channels:
+            raise ValueError("At least one channel is required")
+        if sampling_rate <= 0:
+            raise ValueError("Sampling rate must be positive")
+        self.channels = [str(channel).lower() for channel in channels]
+        self.sampling_rate = float(sampling_rate)
+        self.batcher = batcher
+        self.max_chunk = int(MAX_CHUNK_SEC * self.sampling_rate)
+        self.ring = RingBuffer(self.max_chunk + WINDOW_SIZE, len(self.channels))
+        self.next_window = 0  # absolute index of the first sample of the next window
+
+        self.sos = design_preprocessing(self.sampling_rate, **(filters or {}))
+        self.zi = None
+        self.display_step = max(1, int(round(self.sampling_rate / display_rate)))
+        self.recent = np.zeros((0, len(self.channels), len(CLASS_NAMES)))
+
+    def decode(self, message):
+        """
+        A chunk as (n, n_channels) float32: binary frames are little-endian float32 rows,
+        text frames are JSON {"samples": [[ch0, ch1, ...], ...]}.
+        """
+        if message.get("bytes") is not None:
+            block = np.frombuffer(message["bytes"], dtype="<f4")
+        else:
+            block = np.asarray(json.loads(message["text"])["samples"], dtype=np.float32)
+        if block.size % len(self.channels):
+            raise ValueError(f"Chunk size is not a multiple of {len(self.channels)} channels")
+        block = block.reshape(-1, len(self.channels))
+        if len(block) > self.max_chunk:
+            raise ValueError(f"Chunks are limited to {MAX_CHUNK_SEC:.0f} s ({self.max_chunk} samples)")
+        return np.nan_to_num(block)
+
+    def _filter(self, block):
+        if self.sos is None:
+            return block
+        if self.zi is None:
+            # Start in steady state for the first sample to avoid a step transient
+            self.zi = sosfilt_zi(self.sos)[:, :, None] * block[0][None, None, :]
+        filtered, self.zi = sosfilt(self.sos, block, axis=0, zi=self.zi)
+        return filtered.astype(np.float32)
+
+    def _display(self, filtered):
+        first = self.ring.total - len(filtered)
+        phase = (-first) % self.display_step  # keep the decimation grid continuous across chunks
+        return {
+            "start_time": (first + phase) / self.sampling_rate,
+            "step": self.display_step / self.sampling_rate,
+            "signals": {
+                channel: np.round(filtered[phase::self.display_step, i], 4).tolist()
+                for i, channel in enumerate(self.channels)
+            },
+        }
+
+    async def push(self, block):
+        """Ingests one chunk; returns the display samples and the predictions of any windows it completed."""
+        started = time.perf_counter()
+        filtered = self._filter(block) if len(block) else block
+        self.ring.extend(filtered)
+        display = self._display(filtered) if len(filtered) else None
+
+        n_windows = (self.ring.total - self.next_window) // WINDOW_SIZE
+        predictions = []
+        if n_windows:
+            stop = self.next_window + n_windows * WINDOW_SIZE
+            samples = self.ring.read(self.next_window, stop)
+            # (n_windows, 200, C) -> one row per (window, channel)
+            windows = samples.reshape(n_windows, WINDOW_SIZE, -1).transpose(0, 2, 1).reshape(-1, WINDOW_SIZE)
+            probs = (await self.batcher.submit(windows)).reshape(n_windows, len(self.channels), -1)
+            self.recent = np.concatenate([self.recent, probs])[-ROLLING_WINDOWS:]
+            for k in range(n_windows):
+                predictions.append({
+                    "start_time": (self.next_window + k * WINDOW_SIZE) / self.sampling_rate,
+                    "prediction": dict(zip(CLASS_NAMES, np.round(probs[k].mean(axis=0), 4).tolist())),
+                    "channels": {
+                        channel: dict(zip(CLASS_NAMES, np.round(probs[k, i], 4).tolist()))
+                        for i, channel in enumerate(self.channels)
+                    },
+                })
+            self.next_window = stop
+
+        rolling = None
+        if len(self.recent):
+            rolling = dict(zip(CLASS_NAMES, np.round(self.recent.mean(axis=(0, 1)), 4).tolist()))
+        return {
+            "type": "chunk",
+            "received": self.ring.total,
+            "display": display,
+            "predictions": predictions,
+            "rolling_prediction": rolling,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+
+from app.EEG.services.edf_reader import EdfRecording
+
+CSV_EXTENSIONS = (".csv",)
+EDF_EXTENSIONS = (".edf", ".bdf")
+WFDB_EXTENSIONS = (".hea", ".dat", ".zip")
+ECG_EXTENSIONS = CSV_EXTENSIONS + EDF_EXTENSIONS + WFDB_EXTENSIONS
+
+WFDB_DEFAULT_GAIN = 200.0  # ADC units per mV when a header leaves the gain out
+WFDB_INVALID_16 = -32768   # format 16 marker for a missing sample
+
+
+def is_supported(filename):
+    return filename.lower().endswith(ECG_EXTENSIONS)
+
+
+def select_channels(available, requested):
+    """Positions of the requested channel names (case-insensitive) in `available`; all by default."""
+    if not requested:
+        return list(range(len(available)))
+    lookup = {name.lower(): i for i, name in enumerate(available)}
+    missing = [name for name in requested if name.lower() not in lookup]
+    if missing:
+        raise ValueError(f"Unknown channel(s): {', '.join(missing)}")
+    return [lookup[name.lower()] for name in requested]
+
+
+def sample_range(num_samples, sampling_rate, t_start=0.0, t_end=None):
+    start = min(num_samples, max(0, int(np.floor(t_start * sampling_rate))))
+    stop = num_samples if t_end is None else min(num_samples, int(np.ceil(t_end * sampling_rate)))
+    if stop <= start:
+        raise ValueError("The requested time range holds no samples")
+    return start, stop
+
+
+def _time_axis(start, stop, sampling_rate):
+    # Only a window that does not start at 0 needs its time axis stored
+    return None if start == 0 else np.arange(start, stop) / sampling_rate
+
+
+def read_edf(path, channels=None, t_start=0.0, t_end=None):
+    """
+    EDF / EDF+ / BDF through the memory-mapped EEG reader: channel names and rate come from
+    the header and only the requested signals and records are decoded. Values in mV.
+    """
+    recording = EdfRecording(path)
+    names = [recording.labels[i].strip().lower() for i in recording.signals]
+    columns = select_channels(names, channels)
+    start, stop = sample_range(recording.num_samples, recording.sampling_rate, t_start, t_end)
+    signals = (recording.read(start, stop, columns) / 1000.0).astype(np.float32)
+    return [names[c] for c in columns], _time_axis(start, stop, recording.sampling_rate), signals, recording.sampling_rate
+
+
+def _wfdb_memmappable(header):
+    """One format-16 file holding every signal, one sample per frame, no skew."""
+    return (
+        header.sig_len
+        and all(fmt == "16" for fmt in header.fmt)
+        and len(set(header.file_name)) == 1
+        and all((spf or 1) == 1 for spf in (header.samps_per_frame or [1]))
+        and all(not skew for skew in (header.skew or [0]))
+        and len(set(header.byte_offset or [0])) == 1
+    )
+
+
+def read_wfdb(record_path, channels=None, t_start=0.0, t_end=None):
+    """
+    MIT-BIH style record (record_path without extension, .hea next to its .dat).
+    Format 16 is memory-mapped and only the requested rows and signals are converted;
+    other formats (212, ...) go through wfdb.rdrecord for just the requested range.
+    Values in physical units (mV for MIT-BIH).
+    """
+    import wfdb
+
+    header = wfdb.rdheader(record_path)
+    names = [name.strip().lower() for name in header.sig_name]
+    columns = select_channels(names, channels)
+    fs = float(header.fs)
+
+    if _wfdb_memmappable(header):
+        start, stop = sample_range(header.sig_len, fs, t_start, t_end)
+        path = os.path.join(os.path.dirname(record_path), header.file_name[0])
+        offset = (header.byte_offset or [0])[0] or 0
+        raw = np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(header.sig_len, header.n_sig))
+        digital = np.asarray(raw[start:stop][:, columns])
+        gain = np.array([g or WFDB_DEFAULT_GAIN for g in header.adc_gain], dtype=np.float32)[columns]
+        baseline = np.array(header.baseline, dtype=np.float32)[columns]
+        signals = (digital.astype(np.float32) - baseline) / gain
+        signals[digital == WFDB_INVALID_16] = np.nan
+    else:
+        num_samples = header.sig_len or wfdb.rdrecord(record_path, channels=[columns[0]]).sig_len
+        start, stop = sample_range(num_samples, fs, t_start, t_end)
+        record = wfdb.rdrecord(record_path, sampfrom=start, sampto=stop, channels=columns, return_res=32)
+        signals = np.asarray(record.p_signal, dtype=np.float32)
+
+    return [names[c] for c in columns], _time_axis(start, stop, fs), signals, fs
+
+
+def _find_record(directory):
+    """The record inside an extracted archive: a WFDB header, else an EDF/BDF or CSV file."""
+    found = {}
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            found.setdefault(os.path.splitext(name)[1].lower(), os.path.join(root, name))
+    for ext in (".hea",) + EDF_EXTENSIONS + CSV_EXTENSIONS:
+        if ext in found:
+            return found[ext]
+    raise ValueError("The archive holds no .hea, .edf, .bdf or .csv record")
+
+
+def read_ecg_upload(uploads, read_csv, channels=None, t_start=0.0, t_end=None):
+    """
+    uploads: [(filename, fileobj), ...]; the first is the record, the rest its companions
+    (the .dat of a .hea). CSV bytes go to read_csv; binary formats are copied to a temporary
+    directory once and read from there. Returns (channels, time, signals, sampling_rate).
+    """
+    filename, fileobj = uploads[0]
+    ext = os.path.splitext(filename)[1].lower()
+
+    if ext in CSV_EXTENSIONS:
+        fileobj.seek(0)
+        names, time, signals, sampling_rate = read_csv(fileobj.read())
+        columns = select_channels(names, channels)
+        if time is None:
+            start, stop = sample_range(len(signals), sampling_rate, t_start, t_end)
+            rows = slice(start, stop)
+            time = _time_axis(start, stop, sampling_rate)
+        else:
+            rows = (time >= t_start) & (time < (np.inf if t_end is None else t_end))
+            if not rows.any():
+                raise ValueError("The requested time range holds no samples")
+            time = time[rows]
+        return [names[c] for c in columns], time, signals[rows][:, columns], sampling_rate
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, obj in uploads:
+            obj.seek(0)
+            with open(os.path.join(directory, os.path.basename(name)), "wb") as out:
+                shutil.copyfileobj(obj, out, 1024 * 1024)
+        path = os.path.join(directory, os.path.basename(filename))
+
+        if ext == ".zip":
+            with zipfile.ZipFile(path) as archive:
+                archive.extractall(os.path.join(directory, "archive"))
+            path = _find_record(os.path.join(directory, "archive"))
+            ext = os.path.splitext(path)[1].lower()
+            if ext in CSV_EXTENSIONS:
+                with open(path, "rb") as f:
+                    return read_ecg_upload([(path, f)], read_csv, channels, t_start, t_end)
+
+        if ext in EDF_EXTENSIONS:
+            return read_edf(path, channels, t_start, t_end)
+        if ext in (".hea", ".dat"):
+            return read_wfdb(os.path.splitext(path)[0], channels, t_start, t_end)
+    raise ValueError(f"Unsupported ECG file type '{ext}'")
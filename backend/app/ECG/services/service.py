@@ -1,50 +1,125 @@
 import io
 import os
+from functools import lru_cache
 
 import joblib
 import numpy as np
 import onnxruntime as ort
 import pandas as pd
 from scipy import stats
-from scipy.special import softmax
+from scipy.signal import butter, iirnotch, sosfiltfilt, tf2sos
 
+from app.ECG.services.beats import MODEL_RATE, detect_r_peaks, resample_to_model_rate, segment_beats
+from app.ECG.services.cnn_inference import CLASS_NAMES, WINDOW_SIZE, WindowClassifier, aggregate_windows, split_windows
 
-async def parse_ecg(file):
-    contents = await file.read()
-    df = pd.read_csv(io.StringIO(contents.decode("utf-8")))
+
+ECG_SAMPLING_RATE = 360
+
+# Preprocessing defaults: baseline-wander high-pass, mains notch, optional low-pass (0 = off)
+HIGHPASS_HZ = float(os.environ.get("ECG_HIGHPASS_HZ", 0.5))
+NOTCH_HZ = float(os.environ.get("ECG_NOTCH_HZ", 50))
+LOWPASS_HZ = float(os.environ.get("ECG_LOWPASS_HZ", 0))
+NOTCH_Q = 30
+
+
+def read_ecg_table(contents):
+    """
+    CSV bytes -> (channels, time, signals, sampling_rate), parsed once without a text copy.
+    signals is a float64 (num_samples, num_channels) matrix; without a time column the
+    samples are assumed to be 360 Hz.
+    """
+    df = pd.read_csv(io.BytesIO(contents))
     df.columns = [column.lower() for column in df.columns]
 
     if "time" in df.columns:
-        time = df["time"].tolist()
+        time = df["time"].to_numpy(dtype=np.float64)
         channels = [column for column in df.columns if column != "time"]
+        steps = np.diff(time)
+        steps = steps[steps > 0]
+        sampling_rate = 1.0 / float(np.median(steps)) if len(steps) else ECG_SAMPLING_RATE
     else:
-        sampling_rate = 360
-        time = [index / sampling_rate for index in range(len(df))]
+        time = None
         channels = df.columns.tolist()
-
-    signals = {channel: df[channel].astype(float).tolist() for channel in channels}
-
+        sampling_rate = ECG_SAMPLING_RATE
+
+    signals = df[channels].to_numpy(dtype=np.float64)
+    return channels, time, signals, sampling_rate
+
+
+@lru_cache(maxsize=32)
+def design_preprocessing(fs, highpass=HIGHPASS_HZ, notch=NOTCH_HZ, lowpass=LOWPASS_HZ, order=2):
+    """
+    High-pass (baseline wander), notch (50/60 Hz mains) and optional low-pass as one cascade
+    of second-order sections, designed once per (rate, settings). Stages that do not fit
+    below Nyquist are left out; None when no stage applies.
+    """
+    nyq = 0.5 * fs
+    sections = []
+    if highpass and highpass < nyq:
+        sections.append(butter(order, highpass, btype="highpass", fs=fs, output="sos"))
+    if notch and notch < nyq:
+        b, a = iirnotch(notch, NOTCH_Q, fs)
+        sections.append(tf2sos(b, a))
+    if lowpass and lowpass < nyq:
+        sections.append(butter(2 * order, lowpass, btype="lowpass", fs=fs, output="sos"))
+    if not sections:
+        return None
+    sos = np.vstack(sections)
+    sos.setflags(write=False)
+    return sos
+
+
+def preprocess_ecg(signals, sampling_rate, highpass=HIGHPASS_HZ, notch=NOTCH_HZ, lowpass=LOWPASS_HZ):
+    """
+    Zero-phase filtering of a (samples x leads) matrix: every lead in one axis-wise
+    sosfiltfilt pass over float32. Missing samples are interpolated first, since a NaN
+    would spread over the whole lead.
+    """
+    x = np.array(signals, dtype=np.float32)
+    sos = design_preprocessing(float(sampling_rate), highpass or 0, notch or 0, lowpass or 0)
+    if sos is None or len(x) < 2:
+        return x
+
+    for lead in np.flatnonzero(np.isnan(x).any(axis=0)):
+        valid = ~np.isnan(x[:, lead])
+        x[:, lead] = np.interp(np.arange(len(x)), np.flatnonzero(valid), x[valid, lead]) if valid.any() else 0.0
+
+    padlen = min(3 * (2 * len(sos) + 1), len(x) - 1)
+    return sosfiltfilt(sos.astype(np.float32), x, axis=0, padlen=padlen).astype(np.float32, copy=False)
+
+
+def ecg_payload(channels, time, signals, sampling_rate):
+    """Viewer response: time axis and one float list per channel."""
+    if time is None:
+        time = np.arange(len(signals)) / sampling_rate
     return {
         "num_channels": len(channels),
         "channels": channels,
-        "num_samples": len(df),
-        "duration": float(time[-1]) if time else None,
-        "time": time,
-        "signals": signals,
+        "num_samples": len(signals),
+        "duration": float(time[-1]) if len(time) else None,
+        "time": np.asarray(time).tolist(),
+        "signals": {channel: signals[:, i].astype(float).tolist() for i, channel in enumerate(channels)},
     }
 
 
+async def parse_ecg(file):
+    contents = await file.read()
+    channels, time, signals, sampling_rate = read_ecg_table(contents)
+    return ecg_payload(channels, time, preprocess_ecg(signals, sampling_rate), sampling_rate)
+
+
 base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 onnx_path = os.path.join(base_path, "notebook", "light_ecg_cnn_balanced.onnx")
 classic_model_path = os.path.join(base_path, "notebook", "balanced_rf_ecg.pkl")
 
 ai_session = None
-input_name = None
+cnn_classifier = None
 
 try:
     ai_session = ort.InferenceSession(str(onnx_path))
-    input_name = ai_session.get_inputs()[0].name
-    print("Light ECG CNN model loaded successfully")
+    # Input layout is resolved here once, not per request
+    cnn_classifier = WindowClassifier(ai_session)
+    print(f"Light ECG CNN model loaded successfully (input layout {cnn_classifier.layout})")
 except Exception as error:
     print(f"Failed to load AI model: {error}")
 
@@ -73,7 +148,7 @@ _load_classical_model()
 
 
 def is_pretrained_available():
-    return ai_session is not None
+    return cnn_classifier is not None
 
 
 def is_classical_available():
@@ -89,34 +164,6 @@ def _normalized_prediction(values_by_label):
     return {"prediction": prediction}
 
 
-def _run_onnx_with_flexible_shape(signal, session, session_input_name):
-    candidates = [
-        signal.reshape(1, 200),
-        signal.reshape(1, 1, 200),
-        signal.reshape(1, 200, 1),
-    ]
-    for signal_array in candidates:
-        try:
-            return session.run(None, {session_input_name: signal_array})[0]
-        except Exception:
-            continue
-    raise RuntimeError("ONNX inference failed for all supported input shapes")
-
-
-def _vector_to_prediction(vector):
-    class_names = ["Normal", "AFib", "PVC", "LBBB", "RBBB"]
-    values = np.asarray(vector, dtype=np.float32).reshape(-1)
-    if values.size == 0:
-        return _normalized_prediction({})
-    if np.any(values < 0) or np.any(values > 1) or not np.isclose(np.sum(values), 1.0, atol=1e-2):
-        probs = softmax(values)
-    else:
-        total = float(np.sum(values))
-        probs = values / total if total > 0 else values
-    mapped = {class_names[index]: float(probs[index]) for index in range(min(len(class_names), len(probs)))}
-    return _normalized_prediction(mapped)
-
-
 def _label_to_class_name(label):
     class_map = {0: "Normal", 1: "AFib", 2: "PVC", 3: "LBBB", 4: "RBBB"}
     if isinstance(label, str):
@@ -127,34 +174,60 @@ def _label_to_class_name(label):
         return None
 
 
-def extract_features(signal):
-    signal = np.asarray(signal, dtype=np.float32)
-    q25 = np.percentile(signal, 25)
-    q75 = np.percentile(signal, 75)
-    fft_vals = np.abs(np.fft.fft(signal))
-    fft_vals = fft_vals[: len(fft_vals) // 2]
-
-    features = [
-        np.mean(signal),
-        np.std(signal),
-        np.max(signal),
-        np.min(signal),
-        np.ptp(signal),
-        np.median(signal),
+def extract_feature_matrix(windows):
+    """
+    The 15 classical features of every row of a (n_windows, window_len) matrix at once, with
+    the float32 arithmetic of the original per-window extraction the forest was trained on
+    (tests/test_ecg_features.py checks they are bit-identical):
+    one sort gives min, max and median, the variance is computed once (std is its square
+    root, as np.std does) and the spectrum is one batched FFT.
+    """
+    x = np.asarray(windows, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[np.newaxis]
+    n = x.shape[1]
+
+    ordered = np.sort(x, axis=1)
+    # np.min / np.median return NaN for a row with NaNs; sorting moves them to the end
+    has_nan = np.isnan(ordered[:, -1])
+    lo = np.where(has_nan, np.float32(np.nan), ordered[:, 0])
+    hi = ordered[:, -1]
+    median = np.where(has_nan, np.float32(np.nan), ordered[:, (n - 1) // 2:n // 2 + 1].mean(axis=1))
+    # One scalar q per call, as per window (an array q changes the lerp dtype)
+    q25 = np.percentile(ordered, 25, axis=1)
+    q75 = np.percentile(ordered, 75, axis=1)
+
+    mean = x.mean(axis=1)
+    var = x.var(axis=1)
+    # The rfft would differ from the full FFT the forest was trained on in the last bits
+    fft_vals = np.abs(np.fft.fft(x, axis=1))[:, : n // 2]
+
+    features = np.column_stack([
+        mean,
+        np.sqrt(var),
+        hi,
+        lo,
+        hi - lo,
+        median,
         q25,
         q75,
-        stats.skew(signal),
-        stats.kurtosis(signal),
-        np.var(signal),
-        np.sqrt(np.mean(signal**2)),
-        np.sum(np.abs(np.diff(signal))),
-        np.sum(fft_vals),
-        np.argmax(fft_vals),
-    ]
-    return np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0).tolist()
-
-
-async def predict_ecg(parsed_data, model_type="pretrained"):
+        stats.skew(x, axis=1),
+        stats.kurtosis(x, axis=1),
+        var,
+        np.sqrt((x**2).mean(axis=1)),
+        np.abs(np.diff(x, axis=1)).sum(axis=1),
+        fft_vals.sum(axis=1),
+        np.argmax(fft_vals, axis=1),
+    ]).astype(np.float64)
+    return np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def predict_ecg(signals, channels, model_type="pretrained", sampling_rate=ECG_SAMPLING_RATE):
+    """
+    signals: (num_samples, num_channels) array, e.g. a stored record's memory map.
+    Either model classifies every 200-sample window of every channel in one batch and the
+    window probabilities are averaged into the record-level prediction.
+    """
     default_prediction = {
         "prediction": {
             "Normal": 0.8,
@@ -166,56 +239,101 @@ async def predict_ecg(parsed_data, model_type="pretrained"):
     }
     model_type = (model_type or "pretrained").lower()
 
-    channels = parsed_data.get("channels", [])
     if not channels:
         return _normalized_prediction({})
 
-    signal = np.array(parsed_data["signals"][channels[0]])
-
     if model_type == "pretrained":
-        if ai_session is None:
+        if cnn_classifier is None:
             return default_prediction
 
-        if len(signal) > 200:
-            signal = signal[:200]
-        elif len(signal) < 200:
-            signal = np.pad(signal, (0, 200 - len(signal)), "constant")
-        signal = signal.astype(np.float32)
-
         try:
-            raw_outputs = _run_onnx_with_flexible_shape(signal, ai_session, input_name)
-            return _vector_to_prediction(raw_outputs[0] if np.asarray(raw_outputs).ndim > 1 else raw_outputs)
+            probs = cnn_classifier.predict_record(signals)
         except Exception as error:
             print(f"ONNX Inference Error: {error}")
             return default_prediction
+        result = aggregate_windows(probs, channels, sampling_rate)
+        return {**_normalized_prediction(result["prediction"]), "windows": result["windows"]}
 
     if model_type == "classical":
         if not _load_classical_model():
             return default_prediction
 
-        features = extract_features(signal)
-
         try:
-            pred = classic_model.predict([features])[0]
-
-            if hasattr(classic_model, "predict_proba"):
-                probs = classic_model.predict_proba([features])[0]
-                if hasattr(classic_model, "classes_"):
-                    mapped = {}
-                    for cls, prob in zip(classic_model.classes_, probs):
-                        class_name = _label_to_class_name(cls)
-                        if class_name is not None:
-                            mapped[class_name] = float(prob)
-                    return _normalized_prediction(mapped)
-                return _vector_to_prediction(probs)
-
-            class_name = _label_to_class_name(pred)
-            if class_name is None:
-                print(f"Warning: Could not map prediction '{pred}' to a known class.")
-                return _normalized_prediction({})
-            return _normalized_prediction({class_name: 1.0})
+            windows = split_windows(signals)
+            n_channels, n_windows = windows.shape[:2]
+            features = extract_feature_matrix(windows.reshape(-1, WINDOW_SIZE))
+            probs = _classical_probabilities(features).reshape(n_channels, n_windows, -1)
         except Exception as error:
             print(f"Classical Model Inference Error: {error}")
             return default_prediction
+        result = aggregate_windows(probs, channels, sampling_rate)
+        return {**_normalized_prediction(result["prediction"]), "windows": result["windows"]}
 
     return default_prediction
+
+
+def _classical_probabilities(feature_rows):
+    """(n, n_features) -> (n, 5) random-forest probabilities in CLASS_NAMES order, one call for all rows."""
+    out = np.zeros((len(feature_rows), len(CLASS_NAMES)))
+    if hasattr(classic_model, "predict_proba"):
+        probs = classic_model.predict_proba(feature_rows)
+        labels = getattr(classic_model, "classes_", range(probs.shape[1]))
+        for col, label in enumerate(labels):
+            class_name = _label_to_class_name(label)
+            if class_name is not None:
+                out[:, CLASS_NAMES.index(class_name)] = probs[:, col]
+        return out
+    for row, label in enumerate(classic_model.predict(feature_rows)):
+        class_name = _label_to_class_name(label)
+        if class_name is not None:
+            out[row, CLASS_NAMES.index(class_name)] = 1.0
+    return out
+
+
+def window_probabilities(windows, model_type="pretrained"):
+    """(n, 200) windows -> (n, 5) probabilities from either model; raises when it is unavailable."""
+    if model_type == "pretrained":
+        if cnn_classifier is None:
+            raise RuntimeError("Pretrained ECG model is unavailable")
+        return cnn_classifier.predict_windows(windows)
+    if not _load_classical_model():
+        raise RuntimeError("Classical ECG model is unavailable")
+    return _classical_probabilities(extract_feature_matrix(windows))
+
+
+def classify_beats(signals, channels, model_type="pretrained", sampling_rate=ECG_SAMPLING_RATE, channel=None):
+    """
+    Beat-by-beat classification of a whole record: R peaks are detected on one lead
+    (the first unless `channel` is given) resampled to 360 Hz, every beat is cut out as a
+    200-sample window around its R peak, and all beats go through the model in batches.
+    Returns None when the requested model is unavailable.
+    """
+    lead = channels.index(channel) if channel is not None else 0
+    signal = resample_to_model_rate(signals[:, lead], sampling_rate)
+    r_peaks = detect_r_peaks(signal, MODEL_RATE)
+    beats = segment_beats(signal, r_peaks)
+
+    if model_type == "pretrained":
+        if cnn_classifier is None:
+            return None
+        probs = cnn_classifier.predict_windows(beats) if len(beats) else np.zeros((0, len(CLASS_NAMES)))
+    else:
+        if not _load_classical_model():
+            return None
+        probs = _classical_probabilities(extract_feature_matrix(beats)) if len(beats) else np.zeros((0, len(CLASS_NAMES)))
+
+    labels = np.argmax(probs, axis=1)
+    counts = np.bincount(labels, minlength=len(CLASS_NAMES))
+    rr = np.diff(r_peaks) / MODEL_RATE
+    return {
+        "model": model_type,
+        "channel": channels[lead],
+        "num_beats": int(len(r_peaks)),
+        "heart_rate": float(60.0 / np.median(rr)) if len(rr) else None,
+        "beat_times": (r_peaks / MODEL_RATE).tolist(),
+        "labels": [CLASS_NAMES[k] for k in labels],
+        "confidence": np.round(probs.max(axis=1, initial=0.0), 4).tolist(),
+        "counts": {name: int(c) for name, c in zip(CLASS_NAMES, counts)},
+        **_normalized_prediction(dict(zip(CLASS_NAMES, counts.tolist()))),
+    }
+
@@ -1,31 +1,172 @@
-from fastapi import APIRouter,File,UploadFile,HTTPException,status, Query
-from app.EEG.schemas.schema import AnalysisResponse , PaginatedSignalResponse
+from fastapi import APIRouter,File,UploadFile,HTTPException,status, Query, Header, Response
+from fastapi.concurrency import run_in_threadpool
+from app.EEG.schemas.schema import AnalysisResponse , PaginatedSignalResponse, ViewportResponse, SessionStoreStats, TimelineResponse, ConnectivityResponse, BandPowerResponse
+from app.EEG.services.bandpower import frame_times, load_spectral
+from app.EEG.services.connectivity import SEGMENT_SEC, coherence_matrices, correlation_matrix
+from app.EEG.services.edf_reader import EdfRecording, is_edf
 from app.EEG.services.extract_info import FeatureExtractor
 from app.EEG.services.predictions import AiPredictor
+from app.EEG.services.quality import load_quality, save_quality, summarize, window_bad_fraction
+from app.EEG.services.session_store import SessionStore
+from app.EEG.services.streaming import chunk_reader
+from app.EEG.services.wire_format import ARROW_MEDIA_TYPE, BINARY_MEDIA_TYPE, encode_arrow, encode_binary, negotiate
 from io import BytesIO
+from typing import Optional
+import math
+import os
+import numpy as np
 import pandas as pd
+import shutil
+import tempfile
 import uuid
-import json
-import os
 
 EEG_Router = APIRouter()
 extractor = FeatureExtractor()
 predictor = AiPredictor()
 
 TEMP_DIR = "temp_signal_data"
-os.makedirs(TEMP_DIR, exist_ok=True)
+
+# Session eviction: unused for a day, or least recently used beyond 2 GB
+SESSION_TTL_SECONDS = float(os.environ.get("EEG_SESSION_TTL_SECONDS", 24 * 3600))
+SESSION_MAX_BYTES = int(os.environ.get("EEG_SESSION_MAX_BYTES", 2 * 1024 ** 3))
+SESSION_SWEEP_SECONDS = float(os.environ.get("EEG_SESSION_SWEEP_SECONDS", 300))
+
+store = SessionStore(TEMP_DIR, ttl_seconds=SESSION_TTL_SECONDS, max_bytes=SESSION_MAX_BYTES)
+store.start_sweeper(SESSION_SWEEP_SECONDS)
+
+# Rows per record batch when an upload is ingested in streaming mode
+STREAM_CHUNK_ROWS = 200_000
+
+# Streamed uploads are classified from this many seconds of raw rows around the middle of the recording
+STREAM_PREDICT_SEC = float(os.environ.get("EEG_STREAM_PREDICT_SEC", 600))
+
+# Longest full-resolution spectrogram tile (in STFT frames, one per second)
+MAX_SPECTROGRAM_FRAMES = 3600
+
+
+def _ingest_stream(open_chunks, source_rate=None):
+    """
+    Cleans, filters and stores the upload chunk by chunk instead of loading it whole.
+    The predictor gets the same raw rows as in the default path, but at most
+    STREAM_PREDICT_SEC of them centred on the middle of the recording (the DL model
+    already looks only at the middle 10 s); the span used is returned as prediction_span.
+    The timeline endpoint classifies the whole session.
+    """
+    file_id = str(uuid.uuid4())
+    fs = source_rate or extractor.fs
+    try:
+        metadata, sampling_rate, quality, raw = extractor.extract_stream(
+            open_chunks, store, file_id, sampling_rate=source_rate, raw_span_sec=STREAM_PREDICT_SEC)
+    except Exception as e:
+        print("ERROR:", e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not parse file"
+        )
+
+    if metadata is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Uploaded file is empty"
+        )
+
+    first_row, raw_rows = raw
+    predictions = predictor.predict(raw_rows, fs)
+
+    return {
+        "file_id": file_id,
+        "features": metadata,
+        "predictions": predictions,
+        "quality": _store_quality(file_id, quality, metadata["channels"]),
+        "prediction_span": [first_row / fs, (first_row + len(raw_rows)) / fs]
+    }
+
+
+def _ingest_edf(file, stream, chunk_rows):
+    """
+    EDF / EDF+ / BDF: the upload is copied to disk once and memory-mapped; channel names and
+    the sampling rate come from the header, and samples are decoded straight to floats.
+    """
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(file.filename)[1], dir=TEMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            file.file.seek(0)
+            shutil.copyfileobj(file.file, out, 1024 * 1024)
+
+        try:
+            recording = EdfRecording(path)
+        except Exception as e:
+            print("ERROR:", e)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Could not parse file"
+            )
+        if recording.num_samples == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Uploaded file is empty"
+            )
+
+        if stream:
+            return _ingest_stream(lambda: recording.iter_chunks(chunk_rows), recording.sampling_rate)
+        return _analyze_frame(recording.to_frame(), recording.sampling_rate)
+    finally:
+        os.remove(path)
+
+
+def _analyze_frame(df, source_rate=None):
+    metadata, signals, sampling_rate, quality = extractor.extract(df, source_rate)
+    predictions = predictor.predict(df, source_rate or extractor.fs)
+
+    file_id = str(uuid.uuid4())
+    store.save(file_id, signals, metadata["channels"], sampling_rate)
+
+    return {
+        "file_id": file_id,
+        "features": metadata,
+        "predictions": predictions,
+        "quality": _store_quality(file_id, quality, metadata["channels"])
+    }
+
+
+def _store_quality(file_id, scorer, channels):
+    """Keeps the per-second mask with the session (the timeline skips bad windows with it) and summarizes it."""
+    mask = scorer.finish()
+    save_quality(store, file_id, mask, scorer.window_sec)
+    return summarize(mask, channels, scorer.window_sec)
+
+
+def _binary_response(accept, times, block, channels, **fields):
+    """Arrow / raw float32 payload built straight from the stored arrays, or None for JSON."""
+    media_type = negotiate(accept)
+    if media_type == BINARY_MEDIA_TYPE:
+        return Response(content=encode_binary(times, block, channels, **fields), media_type=media_type)
+    if media_type == ARROW_MEDIA_TYPE:
+        return Response(content=encode_arrow(times, block, channels, **fields), media_type=media_type)
+    return None
 
 
 # 1 - endpoint for data extraction and ai predictions 
 @EEG_Router.post('/EEG', response_model=AnalysisResponse)
-async def get_info(file: UploadFile = File(...)):
+async def get_info(
+    file: UploadFile = File(...),
+    stream: bool = Query(False, description="Ingest in record batches with bounded memory (large recordings); predictions then cover only the middle of the recording, see prediction_span"),
+    chunk_rows: int = Query(STREAM_CHUNK_ROWS, ge=1000, description="Rows per batch in streaming mode")
+):
 
-    if not (file.filename.endswith(".csv") or file.filename.endswith(".parquet")):
+    if not (file.filename.endswith(".csv") or file.filename.endswith(".parquet") or is_edf(file.filename)):
         raise HTTPException(
             status_code=status.HTTP_406_NOT_ACCEPTABLE,
-            detail="Only CSV or Parquet files allowed"
+            detail="Only CSV, Parquet or EDF/BDF files allowed"
         )
 
+    # Ingestion reads the whole upload and runs the models: keep it off the event loop
+    if is_edf(file.filename):
+        return await run_in_threadpool(_ingest_edf, file, stream, chunk_rows)
+
+    if stream:
+        return await run_in_threadpool(_ingest_stream, chunk_reader(file.filename, file.file, chunk_rows))
+
     try:
         contents = await file.read()
         if file.filename.endswith(".csv"):
@@ -47,54 +188,216 @@ async def get_info(file: UploadFile = File(...)):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Uploaded file is empty"
         )
-        
-    metadata, time_array, signals_dict = extractor.extract(df)
-    predictions = predictor.predict(df)
-    
-    file_id = str(uuid.uuid4())
-    filepath = os.path.join(TEMP_DIR, f"{file_id}.json")
-    
-    
-    # features = extractor.extract(df)
-    # predictions = predictor.predict(df)
 
-    with open(filepath, "w") as f:
-        json.dump({"time": time_array, "signals": signals_dict}, f)
-        
-        
-    return {
-        "file_id": file_id,
-        "features": metadata,
-        "predictions": predictions
-    }
+    return await run_in_threadpool(_analyze_frame, df)
     
 @EEG_Router.get('/EEG/data/{file_id}', response_model=PaginatedSignalResponse)
 async def get_eeg_data(
     file_id: str, 
     page: int = Query(1, ge=1, description="Page number"),
-    limit: int = Query(1000, ge=1, le=5000, description="Data points per page")
+    limit: int = Query(1000, ge=1, le=5000, description="Data points per page"),
+    accept: Optional[str] = Header(None)
 ):
-    filepath = os.path.join(TEMP_DIR, f"{file_id}.json")
-    
-    # Check if the file exists
-    if not os.path.exists(filepath):
+    # Check if the session exists
+    if not store.exists(file_id):
         raise HTTPException(status_code=404, detail="Data file not found. You must analyze a file first.")
 
-    # Load the massive data from the disk
-    with open(filepath, "r") as f:
-        data = json.load(f)
-
     # Calculate start and end indices for pagination
     start_index = (page - 1) * limit
     end_index = start_index + limit
-    total_samples = len(data["time"])
 
-    # Slice the arrays to return only the requested chunk
-    chunk_time = data["time"][start_index:end_index]
-    chunk_signals = {ch: vals[start_index:end_index] for ch, vals in data["signals"].items()}
+    # Only the requested rows are read from the memory-mapped session
+    meta, chunk = store.read_rows(file_id, start_index, end_index)
+    start_index = min(start_index, meta["num_samples"])
+    chunk_time = np.arange(start_index, start_index + len(chunk)) / meta["sampling_rate"]
+
+    binary = _binary_response(accept, chunk_time, chunk, meta["channels"],
+                              total_samples=meta["num_samples"], sampling_rate=meta["sampling_rate"])
+    if binary is not None:
+        return binary
+
+    return {
+        "time": chunk_time.tolist(),
+        "signals": {ch: chunk[:, i].tolist() for i, ch in enumerate(meta["channels"])},
+        "total_samples": meta["num_samples"]
+    }
+
+
+# 3 - endpoint for zoomed viewports served from the min/max pyramid
+@EEG_Router.get('/EEG/viewport/{file_id}', response_model=ViewportResponse)
+async def get_eeg_viewport(
+    file_id: str,
+    t_start: float = Query(0.0, ge=0, description="Viewport start (seconds)"),
+    t_end: Optional[float] = Query(None, ge=0, description="Viewport end (seconds), defaults to the end of the recording"),
+    width: int = Query(1000, ge=1, le=10000, description="Viewport width in pixels"),
+    accept: Optional[str] = Header(None)
+):
+    if not store.exists(file_id):
+        raise HTTPException(status_code=404, detail="Data file not found. You must analyze a file first.")
+    if t_end is not None and t_end <= t_start:
+        raise HTTPException(status_code=400, detail="t_end must be greater than t_start")
+
+    meta = store.load_meta(file_id)
+    sampling_rate = meta["sampling_rate"]
+    start_index = int(math.floor(t_start * sampling_rate))
+    end_index = meta["num_samples"] if t_end is None else int(math.ceil(t_end * sampling_rate))
+
+    meta, bucket, times, block = store.read_viewport(file_id, start_index, end_index, width)
+
+    binary = _binary_response(accept, times, block, meta["channels"], bucket_size=bucket,
+                              total_samples=meta["num_samples"], sampling_rate=sampling_rate)
+    if binary is not None:
+        return binary
+
+    return {
+        "time": times.tolist(),
+        "signals": {ch: block[:, i].tolist() for i, ch in enumerate(meta["channels"])},
+        "bucket_size": bucket,
+        "sampling_rate": sampling_rate,
+        "total_samples": meta["num_samples"]
+    }
+
+
+# 4 - session store usage (bytes, hits, evictions)
+@EEG_Router.get('/EEG/sessions/stats', response_model=SessionStoreStats)
+async def get_session_stats():
+    return store.get_stats()
+
+
+# 5 - sliding-window classification timeline over the whole stored session
+@EEG_Router.get('/EEG/timeline/{file_id}', response_model=TimelineResponse)
+def get_eeg_timeline(
+    file_id: str,
+    window_sec: float = Query(10.0, gt=0, le=120, description="Window length (seconds)"),
+    stride_sec: float = Query(5.0, gt=0, description="Step between window starts (seconds)"),
+    batch_size: int = Query(32, ge=1, le=512, description="Windows per model call"),
+    skip_bad: bool = Query(False, description="Do not classify windows the quality mask marks as bad"),
+    max_bad_fraction: float = Query(0.5, ge=0, le=1, description="Largest share of flagged channel-seconds a kept window may have")
+):
+    # plain 'def': CPU-heavy, FastAPI runs it in the threadpool
+    if not store.exists(file_id):
+        raise HTTPException(status_code=404, detail="Data file not found. You must analyze a file first.")
+
+    meta = store.load_meta(file_id)
+    sampling_rate = meta["sampling_rate"]
+    signals = store.open_signals(file_id, meta)
+    window = max(1, int(round(window_sec * sampling_rate)))
+    stride = max(1, int(round(stride_sec * sampling_rate)))
+    num_samples = meta["num_samples"]
+    if num_samples < window:
+        raise HTTPException(status_code=400, detail="Recording is shorter than one window")
+
+    starts = np.arange(0, num_samples - window + 1, stride)
+    skipped = np.zeros(0, dtype=starts.dtype)
+    if skip_bad:
+        info, mask = load_quality(store, file_id, len(meta["channels"]))
+        if mask is not None:
+            bad = window_bad_fraction(mask, info["window_sec"], starts / sampling_rate,
+                                      (starts + window) / sampling_rate) > max_bad_fraction
+            starts, skipped = starts[~bad], starts[bad]
 
+    ml_batches, dl_batches = [], []
+    for i in range(0, len(starts), batch_size):
+        # Only the rows of this batch of windows are read from the memory-mapped session
+        batch = np.stack([signals[s:s + window] for s in starts[i:i + batch_size]])
+        probs = predictor.predict_windows(batch, meta["channels"], sampling_rate)
+        ml_batches.append(probs["ML_Predictions"])
+        dl_batches.append(probs["DL_Predictions"])
+
+    classes = predictor.classes
+    empty = np.zeros((0, len(classes)))
+    ml_probs = np.vstack(ml_batches or [empty]).astype(np.float64)
+    dl_probs = np.vstack(dl_batches or [empty]).astype(np.float64)
     return {
-        "time": chunk_time,
-        "signals": chunk_signals,
-        "total_samples": total_samples
-    }
\ No newline at end of file
+        "window_sec": window / sampling_rate,
+        "stride_sec": stride / sampling_rate,
+        "classes": classes,
+        "start_times": (starts / sampling_rate).tolist(),
+        "ML_Predictions": {c: np.round(ml_probs[:, k], 4).tolist() for k, c in enumerate(classes)},
+        "DL_Predictions": {c: np.round(dl_probs[:, k], 4).tolist() for k, c in enumerate(classes)},
+        "skipped_start_times": (skipped / sampling_rate).tolist(),
+    }
+
+
+# 6 - all-pairs coherence (per band) and correlation over a time window of the session
+@EEG_Router.get('/EEG/connectivity/{file_id}', response_model=ConnectivityResponse)
+def get_eeg_connectivity(
+    file_id: str,
+    t_start: float = Query(0.0, ge=0, description="Window start (seconds)"),
+    t_end: Optional[float] = Query(None, ge=0, description="Window end (seconds), defaults to the end of the recording"),
+    segment_sec: float = Query(SEGMENT_SEC, gt=0, le=60, description="Welch segment length (seconds)")
+):
+    if not store.exists(file_id):
+        raise HTTPException(status_code=404, detail="Data file not found. You must analyze a file first.")
+    if t_end is not None and t_end <= t_start:
+        raise HTTPException(status_code=400, detail="t_end must be greater than t_start")
+
+    meta = store.load_meta(file_id)
+    sampling_rate = meta["sampling_rate"]
+    start_index = min(int(math.floor(t_start * sampling_rate)), meta["num_samples"])
+    end_index = meta["num_samples"] if t_end is None else min(int(math.ceil(t_end * sampling_rate)), meta["num_samples"])
+    if end_index - start_index < int(round(segment_sec * sampling_rate)):
+        raise HTTPException(status_code=400, detail="Window is shorter than one segment")
+
+    # Slicing the memmap reads nothing yet; both passes pull the window in chunks
+    window = store.open_signals(file_id, meta)[start_index:end_index]
+    coherence = coherence_matrices(window, sampling_rate, segment_sec)
+    correlation = correlation_matrix(window)
+
+    return {
+        "channels": meta["channels"],
+        "t_start": start_index / sampling_rate,
+        "t_end": end_index / sampling_rate,
+        "segment_sec": segment_sec,
+        "coherence": {band: np.round(m, 4).tolist() for band, m in coherence.items()},
+        "correlation": np.round(correlation, 4).tolist(),
+    }
+
+
+# 7 - per-channel band power over time (and spectrogram tiles), cached with the session
+@EEG_Router.get('/EEG/bandpower/{file_id}', response_model=BandPowerResponse)
+def get_eeg_bandpower(
+    file_id: str,
+    t_start: float = Query(0.0, ge=0, description="Tile start (seconds)"),
+    t_end: Optional[float] = Query(None, ge=0, description="Tile end (seconds), defaults to the end of the recording"),
+    relative: bool = Query(False, description="Band power as a fraction of the total over all bands"),
+    spectrogram: bool = Query(False, description="Also return the full spectrogram (dB) of the tile")
+):
+    # plain 'def': the first request of a session runs the STFT over the whole recording
+    if not store.exists(file_id):
+        raise HTTPException(status_code=404, detail="Data file not found. You must analyze a file first.")
+    if t_end is not None and t_end <= t_start:
+        raise HTTPException(status_code=400, detail="t_end must be greater than t_start")
+
+    meta = store.load_meta(file_id)
+    info, bandpower, spec = load_spectral(store, file_id, meta)
+    times = frame_times(info)
+    first = int(np.searchsorted(times, t_start, side="left"))
+    last = len(times) if t_end is None else int(np.searchsorted(times, t_end, side="right"))
+    if spectrogram and last - first > MAX_SPECTROGRAM_FRAMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Spectrogram tiles are limited to {MAX_SPECTROGRAM_FRAMES} frames; narrow the time range"
+        )
+
+    tile = np.asarray(bandpower[first:last], dtype=np.float64)
+    if relative:
+        total = tile.sum(axis=2, keepdims=True)
+        tile = np.divide(tile, total, out=np.zeros_like(tile), where=total > 0)
+
+    bands = list(info["params"]["bands"])
+    response = {
+        "channels": meta["channels"],
+        "bands": bands,
+        "time": times[first:last].tolist(),
+        "band_power": {
+            ch: {band: np.round(tile[:, i, b], 6).tolist() for b, band in enumerate(bands)}
+            for i, ch in enumerate(meta["channels"])
+        },
+        "relative": relative,
+    }
+    if spectrogram:
+        db = 10 * np.log10(np.asarray(spec[first:last], dtype=np.float64) + 1e-12)
+        response["freqs"] = info["freqs"]
+        response["spectrogram"] = {ch: np.round(db[:, i, :].T, 2).tolist() for i, ch in enumerate(meta["channels"])}
+    return response
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 
 class FeaturesMetadata(BaseModel) :
@@ -14,12 +14,73 @@ class AIPredictions(BaseModel):
     ML_Predictions : dict
     DL_Predictions : dict 
 
+class ChannelQuality(BaseModel):
+    bad_fraction: float
+    flag_windows: Dict[str, int]
+    segments: List[List[float]]  # [start_sec, end_sec, flag_bits]
+
+class QualityReport(BaseModel):
+    window_sec: float
+    num_windows: int
+    flags: List[str]  # bit i of flag_bits <-> flags[i]
+    channels: Dict[str, ChannelQuality]
+
 class AnalysisResponse(BaseModel):
     file_id: str #return the id
     features : FeaturesMetadata
     predictions : AIPredictions
+    quality : Optional[QualityReport] = None
+    prediction_span : Optional[List[float]] = None  # [start, end] seconds the predictions cover (streamed uploads)
     
 class PaginatedSignalResponse(BaseModel):
     time: List[float]
     signals: Dict[str, List[float]]
-    total_samples: int
\ No newline at end of file
+    total_samples: int
+    
+class ViewportResponse(BaseModel):
+    time: List[float]
+    signals: Dict[str, List[float]]
+    bucket_size: int
+    sampling_rate: float
+    total_samples: int
+
+
+class SessionStoreStats(BaseModel):
+    sessions: int
+    bytes_used: int
+    max_bytes: Optional[int]
+    ttl_seconds: Optional[float]
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    bytes_evicted: int
+
+
+class TimelineResponse(BaseModel):
+    window_sec: float
+    stride_sec: float
+    classes: List[str]
+    start_times: List[float]
+    ML_Predictions: Dict[str, List[float]]
+    DL_Predictions: Dict[str, List[float]]
+    skipped_start_times: List[float] = []
+
+
+class ConnectivityResponse(BaseModel):
+    channels: List[str]
+    t_start: float
+    t_end: float
+    segment_sec: float
+    coherence: Dict[str, List[List[float]]]
+    correlation: List[List[float]]
+
+
+class BandPowerResponse(BaseModel):
+    channels: List[str]
+    bands: List[str]
+    time: List[float]
+    band_power: Dict[str, Dict[str, List[float]]]
+    relative: bool
+    freqs: Optional[List[float]] = None
+    spectrogram: Optional[Dict[str, List[List[float]]]] = None
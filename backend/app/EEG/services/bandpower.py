@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import scipy.fft
+import scipy.signal
+
+from app.EEG.services.ml_feature_logic import BANDS
+
+SEGMENT_SEC = 2.0        # STFT segment -> 0.5 Hz resolution
+STEP_SEC = 1.0           # one column per second of recording
+MAX_FREQ = 40.0          # the stored signals are low-passed at 40 Hz
+FRAMES_PER_CHUNK = 512   # STFT frames transformed per FFT call
+
+SPECTRAL_META_FILE = "spectral.json"
+SPECTROGRAM_FILE = "spectrogram.f32"
+BANDPOWER_FILE = "bandpower.f32"
+
+# file_id -> [lock, holders]; an entry lives only while a request holds or waits for it
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _params(sampling_rate):
+    return {
+        "segment_sec": SEGMENT_SEC,
+        "step_sec": STEP_SEC,
+        "max_freq": MAX_FREQ,
+        "sampling_rate": sampling_rate,
+        "bands": {name: list(edges) for name, edges in BANDS.items()},
+    }
+
+
+@contextmanager
+def _session_lock(file_id):
+    with _locks_guard:
+        entry = _locks.setdefault(file_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[file_id]
+
+
+def compute_spectral(signals, sampling_rate, spectrogram_path, bandpower_path):
+    """
+    Streaming STFT over a (n_samples, n_channels) session matrix, one chunk of frames at a time.
+    Writes the one-sided PSD (n_frames, n_channels, n_freqs) and the band powers
+    (n_frames, n_channels, n_bands) as float32 files; returns (n_frames, freqs).
+    """
+    n_samples, n_channels = signals.shape
+    nperseg = int(round(SEGMENT_SEC * sampling_rate))
+    step = int(round(STEP_SEC * sampling_rate))
+    n_frames = max(0, (n_samples - nperseg) // step + 1)
+
+    freqs = scipy.fft.rfftfreq(nperseg, 1 / sampling_rate)
+    n_bins = int(np.searchsorted(freqs, MAX_FREQ, side="right"))
+    freqs = freqs[:n_bins]
+    window = scipy.signal.get_window("hann", nperseg)[:, np.newaxis]
+    # Same density scaling as scipy.signal.welch (one-sided, DC and Nyquist not doubled)
+    scale = np.full(n_bins, 2.0 / (sampling_rate * np.sum(window ** 2)))
+    scale[0] /= 2
+    if nperseg % 2 == 0 and n_bins == nperseg // 2 + 1:
+        scale[-1] /= 2
+    df = freqs[1] - freqs[0]
+    band_masks = np.stack([(freqs >= low) & (freqs < high) for low, high in BANDS.values()], axis=1)
+
+    with open(spectrogram_path, "wb") as spec_fh, open(bandpower_path, "wb") as band_fh:
+        for first in range(0, n_frames, FRAMES_PER_CHUNK):
+            last = min(first + FRAMES_PER_CHUNK, n_frames)
+            rows = np.asarray(signals[first * step:(last - 1) * step + nperseg], dtype=np.float64)
+            frames = np.swapaxes(np.lib.stride_tricks.sliding_window_view(rows, nperseg, axis=0)[::step], 1, 2)
+            frames = (frames - frames.mean(axis=1, keepdims=True)) * window
+            psd = np.abs(scipy.fft.rfft(frames, axis=1, workers=-1)[:, :n_bins]) ** 2 * scale[:, np.newaxis]
+            psd = np.swapaxes(psd, 1, 2)  # (frames, channels, freqs)
+            spec_fh.write(psd.astype("<f4").tobytes())
+            band_fh.write((psd @ band_masks * df).astype("<f4").tobytes())
+    return n_frames, freqs
+
+
+def load_spectral(store, file_id, meta=None):
+    """
+    Band-power and spectrogram tiles of a session, computed on first use and cached in the
+    session directory. Returns (info, bandpower (n_frames, C, n_bands), spectrogram
+    (n_frames, C, n_freqs)) with both arrays memory-mapped.
+    """
+    meta = meta or store.load_meta(file_id)
+    info_path = store.session_path(file_id, SPECTRAL_META_FILE)
+    params = _params(meta["sampling_rate"])
+
+    with _session_lock(file_id):
+        info = None
+        if os.path.exists(info_path):
+            with open(info_path, "r") as f:
+                info = json.load(f)
+            if info.get("params") != params:
+                info = None
+
+        if info is None:
+            spec_path = store.session_path(file_id, SPECTROGRAM_FILE)
+            band_path = store.session_path(file_id, BANDPOWER_FILE)
+            tmp = f".{os.getpid()}.tmp"  # other worker processes may be filling the same cache
+            signals = store.open_signals(file_id, meta)
+            n_frames, freqs = compute_spectral(signals, meta["sampling_rate"], spec_path + tmp, band_path + tmp)
+            os.replace(spec_path + tmp, spec_path)
+            os.replace(band_path + tmp, band_path)
+
+            info = {"params": params, "num_frames": n_frames, "freqs": freqs.tolist()}
+            # Written last: its presence marks the cache as complete
+            with open(info_path + tmp, "w") as f:
+                json.dump(info, f)
+            os.replace(info_path + tmp, info_path)
+            store.notify_written()
+
+    n_channels = len(meta["channels"])
+    shape = (info["num_frames"], n_channels)
+    if info["num_frames"] == 0:
+        return info, np.zeros(shape + (len(BANDS),), dtype="<f4"), np.zeros(shape + (len(info["freqs"]),), dtype="<f4")
+    bandpower = np.memmap(store.session_path(file_id, BANDPOWER_FILE), dtype="<f4", mode="r",
+                          shape=shape + (len(BANDS),))
+    spectrogram = np.memmap(store.session_path(file_id, SPECTROGRAM_FILE), dtype="<f4", mode="r",
+                            shape=shape + (len(info["freqs"]),))
+    return info, bandpower, spectrogram
+
+
+def frame_times(info):
+    """Centre time (seconds) of every STFT frame."""
+    params = info["params"]
+    fs = params["sampling_rate"]
+    nperseg = int(round(params["segment_sec"] * fs))
+    step = int(round(params["step_sec"] * fs))
+    return (np.arange(info["num_frames"]) * step + nperseg / 2) / fs
@@ -0,0 +1,76 @@
+import numpy as np
+import scipy.fft
+import scipy.signal
+
+from app.EEG.services.ml_feature_logic import BANDS
+
+SEGMENT_SEC = 2.0        # Welch segment length -> 0.5 Hz frequency resolution
+SEGMENTS_PER_CHUNK = 256  # segments transformed per FFT call; bounds scratch memory
+ROWS_PER_CHUNK = 200_000  # rows per pass of the correlation accumulator
+
+
+def cross_spectra(signals, fs, nperseg, max_freq, segments_per_chunk=SEGMENTS_PER_CHUNK):
+    """
+    Welch-averaged cross-spectral matrix of all channels at once.
+    signals: (n_samples, n_channels), may be a memmap; read a chunk of segments at a time.
+    Hann window, 50% overlap and per-segment mean removal, as scipy.signal.coherence does.
+    Returns (freqs, S) with S shaped (n_freqs, n_channels, n_channels), complex; only
+    frequencies up to max_freq are kept. Unscaled: coherence does not depend on the scale.
+    """
+    n_samples, n_channels = signals.shape
+    step = nperseg - nperseg // 2
+    n_segments = (n_samples - nperseg) // step + 1
+    freqs = scipy.fft.rfftfreq(nperseg, 1 / fs)
+    n_bins = int(np.searchsorted(freqs, max_freq, side="right"))
+    window = scipy.signal.get_window("hann", nperseg)[:, np.newaxis]
+
+    S = np.zeros((n_bins, n_channels, n_channels), dtype=np.complex128)
+    for first in range(0, n_segments, segments_per_chunk):
+        last = min(first + segments_per_chunk, n_segments)
+        rows = np.asarray(signals[first * step:(last - 1) * step + nperseg], dtype=np.float64)
+        # (n_seg, nperseg, C) strided view over the chunk, no copy until the detrend
+        segments = np.lib.stride_tricks.sliding_window_view(rows, nperseg, axis=0)[::step]
+        segments = np.swapaxes(segments, 1, 2)
+        segments = (segments - segments.mean(axis=1, keepdims=True)) * window
+        X = scipy.fft.rfft(segments, axis=1, workers=-1)[:, :n_bins]
+        # Every channel pair at once: S[f, i, j] += sum over segments of X_i * conj(X_j)
+        S += np.einsum("sfi,sfj->fij", X, X.conj(), optimize=True)
+    return freqs[:n_bins], S
+
+
+def coherence_matrices(signals, fs, segment_sec=SEGMENT_SEC, bands=BANDS):
+    """Magnitude-squared coherence of every channel pair, averaged within each band."""
+    nperseg = int(round(segment_sec * fs))
+    max_freq = max(high for _, high in bands.values())
+    freqs, S = cross_spectra(signals, fs, nperseg, max_freq)
+
+    power = np.real(np.einsum("fii->fi", S))
+    denom = power[:, :, np.newaxis] * power[:, np.newaxis, :]
+    coh = np.divide(np.abs(S) ** 2, denom, out=np.zeros(denom.shape), where=denom > 0)
+
+    out = {}
+    for band, (low, high) in bands.items():
+        mask = (freqs >= low) & (freqs < high)
+        out[band] = coh[mask].mean(axis=0) if mask.any() else np.zeros(coh.shape[1:])
+    return out
+
+
+def correlation_matrix(signals, rows_per_chunk=ROWS_PER_CHUNK):
+    """Pearson correlation of all channels, accumulated over row chunks in float64."""
+    n_samples, n_channels = signals.shape
+    # Shift by the first chunk's mean so the one-pass sums do not lose precision to DC offsets
+    shift = np.asarray(signals[:rows_per_chunk], dtype=np.float64).mean(axis=0)
+    total = np.zeros(n_channels)
+    gram = np.zeros((n_channels, n_channels))
+    for start in range(0, n_samples, rows_per_chunk):
+        rows = np.asarray(signals[start:start + rows_per_chunk], dtype=np.float64) - shift
+        total += rows.sum(axis=0)
+        gram += rows.T @ rows
+
+    mean = total / n_samples
+    cov = gram / n_samples - np.outer(mean, mean)
+    std = np.sqrt(np.clip(np.diag(cov), 0, None))
+    denom = np.outer(std, std)
+    corr = np.divide(cov, denom, out=np.zeros_like(cov), where=denom > 0)
+    np.fill_diagonal(corr, 1.0)
+    return np.clip(corr, -1.0, 1.0)
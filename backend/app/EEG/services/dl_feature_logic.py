@@ -1,89 +1,151 @@
 import numpy as np
 import cv2
 import torch
+import torch.nn.functional as F
 import librosa
-from torchvision import transforms
+import scipy.fft
+import scipy.signal
+from functools import lru_cache
 
 # We need the same chains you used in ML to generate the 4 regions
 FEATS = ['Fp1','F3','C3','P3','F7','T3','T5','O1','Fz','Cz','Pz','Fp2','F4','C4','P4','F8','T4','T6','O2','EKG']
 FEAT2IDX = {x:y for x,y in zip(FEATS, range(len(FEATS)))}
 
-def create_spectrogram_from_eeg(eeg_df):
-    """Reconstructs the Kaggle-style 4-region spectrogram from raw EEG"""
-    # 1. Take the middle 10 seconds (2000 rows at 200Hz) to match Kaggle's focus
-    total_len = len(eeg_df)
-    if total_len > 2000:
-        start = (total_len // 2) - 1000
-        eeg_slice = eeg_df.iloc[start:start+2000].values
+# Left Lateral, Right Lateral, Left Parasagittal, Right Parasagittal
+REGIONS = [
+    ['Fp1', 'F7', 'T3', 'T5', 'O1'],
+    ['Fp2', 'F8', 'T4', 'T6', 'O2'],
+    ['Fp1', 'F3', 'C3', 'P3', 'O1'],
+    ['Fp2', 'F4', 'C4', 'P4', 'O2'],
+]
+
+WINDOW_SAMPLES = 2000   # 10 seconds at 200Hz, Kaggle's focus
+SPEC_SR = 200
+SPEC_N_FFT = 1024
+SPEC_N_MELS = 100
+SPEC_WIDTH = 300
+IMG_SIZE = (224, 224)
+STFT_CHUNK_WINDOWS = 4  # windows framed at once; bounds the (frames x n_fft) scratch memory
+
+def _montage_matrix():
+    """(n_channels, 4): each region is the mean of its 4 bipolar differences"""
+    n_channels = max(FEAT2IDX[ch] for region in REGIONS for ch in region) + 1
+    montage = np.zeros((n_channels, len(REGIONS)))
+    for r, region in enumerate(REGIONS):
+        for a, b in zip(region[:-1], region[1:]):
+            montage[FEAT2IDX[a], r] += 1 / (len(region) - 1)
+            montage[FEAT2IDX[b], r] -= 1 / (len(region) - 1)
+    return montage
+
+MONTAGE = _montage_matrix()
+
+@lru_cache(maxsize=8)
+def _mel_basis(sr=SPEC_SR, n_fft=SPEC_N_FFT, n_mels=SPEC_N_MELS, fmin=0, fmax=20):
+    """Mel filterbank trimmed to the STFT bins it actually uses (fmax=20Hz is ~1/5 of them)"""
+    basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax)
+    n_bins = int(np.flatnonzero(basis.any(axis=0))[-1]) + 1
+    return basis[:, :n_bins]
+
+@lru_cache(maxsize=8)
+def _hann(n_fft=SPEC_N_FFT):
+    return scipy.signal.get_window('hann', n_fft, fftbins=True)
+
+def _stft_power(chains, n_fft, hop_length, n_bins):
+    """
+    Centered (zero-padded) STFT power, same framing and window as librosa.stft,
+    for every chain of every window; only the first n_bins frequencies are kept.
+    chains: (..., n_samples) -> (..., n_bins, n_frames)
+    """
+    padded = np.pad(chains, [(0, 0)] * (chains.ndim - 1) + [(n_fft // 2, n_fft // 2)])
+    frames = np.lib.stride_tricks.sliding_window_view(padded, n_fft, axis=-1)[..., ::hop_length, :]
+    spectrum = scipy.fft.rfft(frames * _hann(n_fft), axis=-1, workers=-1)[..., :n_bins]
+    return np.swapaxes(np.abs(spectrum) ** 2, -1, -2)
+
+@lru_cache(maxsize=1)
+def _jet_lut():
+    """cv2's JET colormap as a (256, 3) BGR lookup table"""
+    return cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), cv2.COLORMAP_JET).reshape(256, 3)
+
+def middle_window(eeg, window=WINDOW_SAMPLES):
+    """Take the middle 10 seconds (2000 rows at 200Hz) to match Kaggle's focus"""
+    total_len = len(eeg)
+    if total_len > window:
+        start = (total_len // 2) - window // 2
+        return eeg[start:start + window]
+    return eeg
+
+def to_feats_order(eeg, channels):
+    """
+    (..., n_channels) with columns named by `channels` -> (..., len(FEATS)) in FEATS order, so
+    the montage picks electrodes by name whatever the upload's column order. Names match
+    case-insensitively; electrodes the upload lacks are zero (EKG is not used).
+    """
+    eeg = np.asarray(eeg, dtype=np.float64)
+    col = {str(name).lower(): i for i, name in enumerate(channels)}
+    ordered = np.zeros(eeg.shape[:-1] + (len(FEATS),))
+    for i, name in enumerate(FEATS):
+        if name.lower() in col:
+            ordered[..., i] = eeg[..., col[name.lower()]]
+    return ordered
+
+def create_spectrograms(windows):
+    """
+    Reconstructs the Kaggle-style 4-region spectrogram for a batch of raw EEG windows.
+    windows: (n_windows, n_samples, n_channels) with channels in FEATS order -> (n_windows, 400, 300)
+    """
+    windows = np.asarray(windows, dtype=np.float64)
+    n_windows, n_samples = windows.shape[:2]
+
+    # 1. The 4 Brain Regions (LL, RL, LP, RP) as one matrix multiply -> (n_windows, 4, n_samples)
+    chains = np.swapaxes(windows[..., :MONTAGE.shape[0]] @ MONTAGE, 1, 2)
+
+    # 2. Batched STFT of every chain + the cached mel filterbank
+    mel_basis = _mel_basis()
+    hop_length = n_samples // SPEC_WIDTH
+    mel_spec = np.concatenate([
+        mel_basis @ _stft_power(chains[i:i + STFT_CHUNK_WINDOWS], SPEC_N_FFT, hop_length, mel_basis.shape[1])
+        for i in range(0, n_windows, STFT_CHUNK_WINDOWS)
+    ])
+
+    # Pad or truncate width to exactly 300
+    width = mel_spec.shape[-1]
+    if width < SPEC_WIDTH:
+        mel_spec = np.pad(mel_spec, ((0, 0), (0, 0), (0, 0), (0, SPEC_WIDTH - width)), mode='constant')
     else:
-        eeg_slice = eeg_df.values
-
-    # 2. Create the 4 Brain Regions (LL, RL, LP, RP)
-    chains = []
-    # Left Lateral (LL)
-    chains.append(np.mean([eeg_slice[:, FEAT2IDX['Fp1']] - eeg_slice[:, FEAT2IDX['F7']],
-                           eeg_slice[:, FEAT2IDX['F7']] - eeg_slice[:, FEAT2IDX['T3']],
-                           eeg_slice[:, FEAT2IDX['T3']] - eeg_slice[:, FEAT2IDX['T5']],
-                           eeg_slice[:, FEAT2IDX['T5']] - eeg_slice[:, FEAT2IDX['O1']]], axis=0))
-    # Right Lateral (RL)
-    chains.append(np.mean([eeg_slice[:, FEAT2IDX['Fp2']] - eeg_slice[:, FEAT2IDX['F8']],
-                           eeg_slice[:, FEAT2IDX['F8']] - eeg_slice[:, FEAT2IDX['T4']],
-                           eeg_slice[:, FEAT2IDX['T4']] - eeg_slice[:, FEAT2IDX['T6']],
-                           eeg_slice[:, FEAT2IDX['T6']] - eeg_slice[:, FEAT2IDX['O2']]], axis=0))
-    # Left Parasagittal (LP)
-    chains.append(np.mean([eeg_slice[:, FEAT2IDX['Fp1']] - eeg_slice[:, FEAT2IDX['F3']],
-                           eeg_slice[:, FEAT2IDX['F3']] - eeg_slice[:, FEAT2IDX['C3']],
-                           eeg_slice[:, FEAT2IDX['C3']] - eeg_slice[:, FEAT2IDX['P3']],
-                           eeg_slice[:, FEAT2IDX['P3']] - eeg_slice[:, FEAT2IDX['O1']]], axis=0))
-    # Right Parasagittal (RP)
-    chains.append(np.mean([eeg_slice[:, FEAT2IDX['Fp2']] - eeg_slice[:, FEAT2IDX['F4']],
-                           eeg_slice[:, FEAT2IDX['F4']] - eeg_slice[:, FEAT2IDX['C4']],
-                           eeg_slice[:, FEAT2IDX['C4']] - eeg_slice[:, FEAT2IDX['P4']],
-                           eeg_slice[:, FEAT2IDX['P4']] - eeg_slice[:, FEAT2IDX['O2']]], axis=0))
-
-    # 3. Generate Spectrograms and stack them horizontally 
+        mel_spec = mel_spec[..., :SPEC_WIDTH]
+
+    # 3. Same layout as stacking to (100, 300, 4) and reshaping to (400, 300) in Fortran order
     # (This mimics Kaggle's 400 frequency bins = 4 regions * 100 bins)
-    img = np.zeros((100, 300, 4), dtype=np.float32)
-    
-    for i, chain in enumerate(chains):
-        # Generate spectrogram matching Kaggle frequencies
-        mel_spec = librosa.feature.melspectrogram(y=chain, sr=200, hop_length=len(chain)//300, 
-                                                  n_fft=1024, n_mels=100, fmin=0, fmax=20)
-        # Pad or truncate width to exactly 300
-        width = mel_spec.shape[1]
-        if width < 300:
-            mel_spec = np.pad(mel_spec, ((0,0), (0, 300-width)), mode='constant')
-        else:
-            mel_spec = mel_spec[:, :300]
-            
-        img[:, :, i] = mel_spec
-
-    # Reshape from (100, 300, 4) to (400, 300)
-    img = img.reshape(400, 300, order='F')
-    return img
+    # (img.reshape(..., order='F') == img.T.reshape(...).T, and img.T is mel_spec as (R, W, H))
+    img = np.swapaxes(mel_spec.astype(np.float32), 2, 3).reshape(n_windows, SPEC_WIDTH, -1)
+    return np.swapaxes(img, 1, 2)
+
+def create_spectrogram_from_eeg(eeg_df):
+    """Reconstructs the Kaggle-style 4-region spectrogram from raw EEG"""
+    eeg_slice = to_feats_order(middle_window(np.asarray(eeg_df.values)), eeg_df.columns)
+    return create_spectrograms(eeg_slice[np.newaxis])[0]
+
+def spectrograms_to_tensor(spec_batch):
+    """(n, 400, 300) spectrograms -> (n, 3, 224, 224) EfficientNet input"""
+    # 1. Apply EXACT transformations from your training script
+    temp = np.log1p(spec_batch)
+    max_val = temp.max(axis=(1, 2), keepdims=True)
+    temp = np.divide(temp, max_val, out=temp, where=max_val > 0)
+    temp_arr = np.nan_to_num(temp, nan=1e-4)
+
+    # 2. Jet Colormap through the precomputed lookup table
+    img_colored = _jet_lut()[np.uint8(255 * temp_arr)]
+
+    # 3. Convert to Tensor (N, C, H, W)
+    img_tensor = torch.from_numpy(img_colored.astype(np.float32) / 255.0).permute(0, 3, 1, 2)
+
+    # 4. Resize to 224x224 (what transforms.Resize does for tensors), whole batch at once
+    return F.interpolate(img_tensor, size=IMG_SIZE, mode='bilinear', align_corners=False, antialias=True)
+
+def preprocess_eeg_windows_for_dl(windows):
+    """(n_windows, n_samples, n_channels) raw EEG -> (n_windows, 3, 224, 224) tensor"""
+    return spectrograms_to_tensor(create_spectrograms(windows))
 
 def preprocess_eeg_for_dl(df):
     """Takes DataFrame, returns PyTorch Tensor for EfficientNet"""
-    # 1. Reconstruct Kaggle format
-    spec_array = create_spectrogram_from_eeg(df)
-    
-    # 2. Apply EXACT transformations from your training script
-    temp_df = np.log1p(spec_array)
-    max_val = temp_df.max()
-    if max_val > 0:
-        temp_df /= max_val
-    temp_arr = np.nan_to_num(temp_df, nan=1e-4)
-    
-    # 3. Jet Colormap
-    temp_arr_uint8 = np.uint8(255 * temp_arr)
-    img_colored = cv2.applyColorMap(temp_arr_uint8, cv2.COLORMAP_JET)
-    
-    # 4. Convert to Tensor
-    img_float = img_colored.astype(np.float32) / 255.0
-    img_tensor = torch.tensor(img_float).permute(2, 0, 1) # (C, H, W)
-    
-    # 5. Resize to 224x224
-    resize_transform = transforms.Resize((224, 224), antialias=True)
-    X_tensor = resize_transform(img_tensor).unsqueeze(0) # (1, 3, 224, 224)
-    
-    return X_tensor
\ No newline at end of file
+    return spectrograms_to_tensor(create_spectrogram_from_eeg(df)[np.newaxis])
@@ -0,0 +1,134 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+EDF_EXTENSIONS = (".edf", ".bdf")
+ANNOTATION_LABELS = ("EDF Annotations", "BDF Annotations")
+
+# Canonical 10-20 names used by the models, plus the newer names of the same electrodes
+CANONICAL_LABELS = ['Fp1', 'F3', 'C3', 'P3', 'F7', 'T3', 'T5', 'O1', 'Fz', 'Cz', 'Pz',
+                    'Fp2', 'F4', 'C4', 'P4', 'F8', 'T4', 'T6', 'O2', 'EKG']
+LABEL_ALIASES = {'t7': 'T3', 't8': 'T4', 'p7': 'T5', 'p8': 'T6', 'ecg': 'EKG', 'ekg1': 'EKG', 'ecg1': 'EKG'}
+REFERENCE_SUFFIXES = ('ref', 'le', 'ar', 'avg', 'a1', 'a2', 'm1', 'm2')
+UNIT_SCALE = {'uv': 1.0, 'µv': 1.0, 'mv': 1e3, 'v': 1e6, 'nv': 1e-3}
+
+
+def normalize_label(label):
+    """'EEG FP1-REF' -> 'Fp1', 'EEG T7-LE' -> 'T3', 'ECG' -> 'EKG'; unknown labels are only stripped."""
+    name = label.strip()
+    for prefix in ("EEG ", "ECG ", "EKG "):
+        if name.upper().startswith(prefix):
+            name = name[len(prefix):].strip()
+            break
+    if '-' in name:
+        head, tail = name.split('-', 1)
+        if tail.strip().lower() in REFERENCE_SUFFIXES:
+            name = head.strip()
+    key = name.lower()
+    canonical = {c.lower(): c for c in CANONICAL_LABELS}
+    return LABEL_ALIASES.get(key) or canonical.get(key) or name
+
+
+class EdfRecording:
+    """
+    EDF / EDF+ / BDF file read through a memory map.
+    The header is parsed once; the data records are mapped as a structured array with one
+    field per signal, so reading a channel over a sample range only touches those bytes.
+    EDF+D (discontinuous) records are treated as back-to-back.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            fixed = f.read(256)
+            if len(fixed) < 256:
+                raise ValueError("File is too short to be EDF/BDF")
+            self.is_bdf = fixed[:1] == b"\xff"
+            header_bytes = int(fixed[184:192])
+            n_signals = int(fixed[252:256])
+            signal_header = f.read(header_bytes - 256)
+
+        self.record_duration = float(fixed[244:252]) or 1.0
+        fields = [16, 80, 8, 8, 8, 8, 8, 80, 8, 32]
+        columns, pos = [], 0
+        for width in fields:
+            raw = signal_header[pos:pos + width * n_signals]
+            columns.append([raw[i * width:(i + 1) * width].decode("latin-1").strip() for i in range(n_signals)])
+            pos += width * n_signals
+        labels, _, units, phys_min, phys_max, dig_min, dig_max, _, samples_per_record, _ = columns
+
+        self.labels = labels
+        self.samples_per_record = np.array([int(n) for n in samples_per_record])
+        self.sample_rates = self.samples_per_record / self.record_duration
+        phys_min, phys_max = np.array(phys_min, float), np.array(phys_max, float)
+        dig_min, dig_max = np.array(dig_min, float), np.array(dig_max, float)
+        # physical = (digital - dig_min) * (phys range / dig range) + phys_min, then to µV
+        gain = (phys_max - phys_min) / np.where(dig_max != dig_min, dig_max - dig_min, 1.0)
+        to_uv = np.array([UNIT_SCALE.get(u.lower(), 1.0) for u in units])
+        self.gain = gain * to_uv
+        self.offset = (phys_min - gain * dig_min) * to_uv
+
+        sample_bytes = 3 if self.is_bdf else 2
+        self.record_dtype = np.dtype([
+            (f"s{i}", "u1" if self.is_bdf else "<i2", (n * sample_bytes if self.is_bdf else n,))
+            for i, n in enumerate(self.samples_per_record)
+        ])
+        # -1 records (still recording / unknown) or a truncated file: trust the file size
+        n_records = (os.path.getsize(path) - header_bytes) // self.record_dtype.itemsize
+        declared = int(fixed[236:244])
+        if declared >= 0:
+            n_records = min(n_records, declared)
+        self.n_records = n_records
+        self.records = np.memmap(path, dtype=self.record_dtype, mode="r", offset=header_bytes, shape=(n_records,))
+
+        # Signals kept for analysis: everything that is not an annotation channel and runs
+        # at the most common sampling rate among them (EEG channels share one rate)
+        data_signals = [i for i, label in enumerate(labels) if label not in ANNOTATION_LABELS]
+        if not data_signals:
+            raise ValueError("EDF file has no data signals")
+        self.sampling_rate = Counter(self.sample_rates[i] for i in data_signals).most_common(1)[0][0]
+        self.signals = [i for i in data_signals if self.sample_rates[i] == self.sampling_rate]
+        self.channels = [normalize_label(labels[i]) for i in self.signals]
+        self.num_samples = int(n_records * self.samples_per_record[self.signals[0]])
+
+    def _digital(self, signal, first_record, last_record):
+        raw = self.records[f"s{signal}"][first_record:last_record]
+        if not self.is_bdf:
+            return raw.reshape(-1).astype(np.float64)
+        raw = raw.reshape(-1, 3).astype(np.int32)
+        value = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return np.where(value >= 1 << 23, value - (1 << 24), value).astype(np.float64)
+
+    def read(self, start=0, stop=None, columns=None):
+        """
+        Samples [start, stop) of the kept signals in µV, shape (n, n_channels) float64.
+        columns: positions in self.channels to read (default all); other signals are not touched.
+        """
+        stop = self.num_samples if stop is None else min(stop, self.num_samples)
+        start = max(0, min(start, stop))
+        per_record = int(self.samples_per_record[self.signals[0]])
+        first_record, last_record = start // per_record, -(-stop // per_record)
+        skip = start - first_record * per_record
+
+        signals = self.signals if columns is None else [self.signals[c] for c in columns]
+        out = np.empty((stop - start, len(signals)))
+        for col, signal in enumerate(signals):
+            digital = self._digital(signal, first_record, last_record)[skip:skip + stop - start]
+            out[:, col] = digital * self.gain[signal] + self.offset[signal]
+        return out
+
+    def to_frame(self, start=0, stop=None):
+        return pd.DataFrame(self.read(start, stop), columns=self.channels)
+
+    def iter_chunks(self, chunk_rows):
+        """DataFrame chunks of about chunk_rows samples, aligned to data records."""
+        per_record = int(self.samples_per_record[self.signals[0]])
+        step = max(1, chunk_rows // per_record) * per_record
+        for start in range(0, self.num_samples, step):
+            yield self.to_frame(start, start + step)
+
+
+def is_edf(filename):
+    return filename.lower().endswith(EDF_EXTENSIONS)
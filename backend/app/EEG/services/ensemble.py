@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import xgboost as xgb
+
+
+class XGBFoldEnsemble:
+    """
+    The cross-validation fold models of the EEG XGBoost path, evaluated together.
+    Boosters are loaded once; every prediction feeds a contiguous float32 batch of
+    feature rows straight to each native booster (no DMatrix / sklearn wrapper).
+    """
+
+    def __init__(self, paths):
+        self.boosters = []
+        for path in paths:
+            if os.path.exists(path):
+                booster = xgb.Booster()
+                booster.load_model(path)
+                self.boosters.append(booster)
+
+    def __len__(self):
+        return len(self.boosters)
+
+    def predict_folds(self, features):
+        """features: (n_rows, n_features) -> raw outputs (n_folds, n_rows, n_classes)"""
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        if features.ndim == 1:
+            features = features[np.newaxis]
+        preds = [booster.inplace_predict(features, validate_features=False) for booster in self.boosters]
+        return np.stack(preds).reshape(len(self.boosters), features.shape[0], -1)
+
+    def predict(self, features):
+        """Averaged normalized class probabilities, (n_rows, n_classes)."""
+        preds = np.clip(self.predict_folds(features).astype(np.float64), 1e-15, 1.0)
+        preds /= np.sum(preds, axis=-1, keepdims=True)
+        return preds.mean(axis=0)
@@ -1,30 +1,36 @@
 import pandas as pd
 import numpy as np
-from scipy.signal import butter, filtfilt, iirnotch
+from app.EEG.services.filters import StatefulSOSFilter, apply_sos, design_sos
+from app.EEG.services.quality import QualityScorer, rail_limits, score_recording
+from app.EEG.services.streaming import RunningStats, interpolate_with_carry
 
 class FeatureExtractor:
     
-    def __init__(self, fs=200, notch_freq=50, downsample_factor=1):
+    def __init__(self, fs=200, notch_freq=50, downsample_factor=1, use_float32=False):
         """
         fs: Sampling frequency (Hz)
         notch_freq: Frequency for notch filter (Hz)
         downsample_factor: Integer factor to downsample signals (1 = no downsampling)
+        use_float32: Run the filters in float32 (half the memory, slightly less precision)
         """
         self.fs = fs
         self.notch_freq = notch_freq
         self.downsample_factor = downsample_factor
+        self.use_float32 = use_float32
 
     # ---------------- CLEANING ----------------
     def _clean(self, df):
+        return self._remove_outliers(self._prepare(df))
+
+    def _prepare(self, df):
         df = df.dropna(how='all')
         df = df.interpolate(method="linear")
         df = df.drop_duplicates()
 
         # Drop EKG safely
-        for ekg_col in ["EKG", "ekg"]:
-            if ekg_col in df.columns:
-                df = df.drop(columns=[ekg_col])
+        return self._drop_ekg(df)
 
+    def _remove_outliers(self, df):
         # Remove extreme outliers (z-score > 5)
         z = np.abs((df - df.mean()) / df.std())
         df[z > 5] = np.nan
@@ -36,36 +42,32 @@ class FeatureExtractor:
         return df
 
     # ---------------- FILTERS ----------------
-    def _bandpass_filter(self, data, low=0.5, high=40, order=4):
-        nyq = 0.5 * self.fs
-        b, a = butter(order, [low / nyq, high / nyq], btype='band')
-        return filtfilt(b, a, data)
-
-    def _notch_filter(self, data, Q=30):
-        b, a = iirnotch(self.notch_freq, Q, self.fs)
-        return filtfilt(b, a, data)
-
-    def _apply_filters(self, df):
-        for col in df.columns:
-            signal = df[col].values
-            signal = self._bandpass_filter(signal)
-            signal = self._notch_filter(signal)
-            df[col] = signal
-        return df
+    def _apply_filters(self, data, low=0.5, high=40, order=4, Q=30, fs=None):
+        # Band-pass + notch designed once per setting, applied to all channels at once
+        sos = design_sos(fs or self.fs, low, high, order, self.notch_freq, Q)
+        return apply_sos(data, sos, use_float32=self.use_float32)
+
+    def _drop_ekg(self, df):
+        return df.drop(columns=[c for c in ["EKG", "ekg"] if c in df.columns])
 
     # ---------------- MAIN EXTRACTION ----------------
-    def extract(self, df):
-        # 1️⃣ Clean
-        cleaned_df = self._clean(df)
+    def extract(self, df, sampling_rate=None):
+        """sampling_rate: rate of the recording when known from the file (EDF), else self.fs"""
+        fs = sampling_rate or self.fs
+
+        # 1️⃣ Clean; quality is scored on the raw samples, before outliers are interpolated away
+        prepared = self._prepare(df)
+        quality = score_recording(prepared.to_numpy(dtype=np.float64), fs, self.notch_freq)
+        cleaned_df = self._remove_outliers(prepared)
 
         # 2️⃣ Filter
-        filtered_df = self._apply_filters(cleaned_df)
+        filtered = self._apply_filters(cleaned_df.to_numpy(), fs=fs)
 
         # 3️⃣ Extract information
-        channels = filtered_df.columns.tolist()
+        channels = cleaned_df.columns.tolist()
         num_channels = len(channels)
-        num_samples = len(filtered_df)
-        duration = num_samples/ self.fs
+        num_samples = len(filtered)
+        duration = num_samples/ fs
         
         metadata = {
             "num_channels": num_channels,
@@ -75,28 +77,102 @@ class FeatureExtractor:
         }
 
         # Apply optional downsampling
+        # The session store keeps a float32 (samples x channels) matrix; time is
+        # implied by the stored sampling rate, so it is no longer materialized here.
+        signals = filtered.astype(np.float32, copy=False)
+        sampling_rate = fs
         if self.downsample_factor > 1:
-            time = (np.arange(num_samples) / self.fs)[::self.downsample_factor].tolist()
-            signals = {
-                ch: filtered_df[ch].iloc[::self.downsample_factor].tolist()
-                for ch in channels
-            }
-        else:
-            time = (np.arange(num_samples) / self.fs).tolist()
-            signals = {
-                ch: filtered_df[ch].tolist()
-                for ch in channels
-            }
-
-        # # Duration in seconds
-        # duration = num_samples / self.fs
-
-        # return {
-        #     "num_channels": num_channels,
-        #     "channels": channels,
-        #     "num_samples": num_samples,
-        #     "duration": duration,
-        #     "time": time,
-        #     "signals": signals
-        # }
-        return metadata, time, signals
\ No newline at end of file
+            signals = np.ascontiguousarray(signals[::self.downsample_factor])
+            sampling_rate = fs / self.downsample_factor
+
+        return metadata, signals, sampling_rate, quality
+
+
+    # ---------------- STREAMING EXTRACTION ----------------
+    def extract_stream(self, open_chunks, store, file_id, low=0.5, high=40, order=4, Q=30, sampling_rate=None,
+                       raw_span_sec=None):
+        """
+        Chunked version of extract() for uploads too large to hold in memory.
+        open_chunks() must return a fresh iterator of DataFrame chunks; it is called twice:
+          pass 1 -> running per-channel mean/std and min/max (outlier removal, DC offset, quality rails)
+          pass 2 -> score quality, clean, filter (causal, state carried across chunks) and write to the store
+        Peak memory is bounded by the chunk size. Differences from extract():
+        duplicate rows are not dropped (not possible without seeing the whole file)
+        and the filter runs forward only instead of zero-phase.
+        raw_span_sec: also keep up to this many seconds of the raw rows, centred on the middle
+        of the recording, for the predictor (which expects raw input, as in the default path).
+        Returns (metadata, sampling_rate, quality, (first_row, raw DataFrame) or None).
+        """
+        fs = sampling_rate or self.fs
+
+        # 1️⃣ Running statistics
+        stats = RunningStats()
+        channels = None
+        rail_min, rail_max = None, None
+        total_rows = 0
+        for chunk in open_chunks():
+            chunk = self._drop_ekg(chunk.dropna(how='all'))
+            if channels is None:
+                channels = chunk.columns.tolist()
+            total_rows += len(chunk)
+            values = chunk.to_numpy(dtype=np.float64)
+            stats.update(values)
+            chunk_min, chunk_max = rail_limits(values)
+            rail_min = chunk_min if rail_min is None else np.fmin(rail_min, chunk_min)
+            rail_max = chunk_max if rail_max is None else np.fmax(rail_max, chunk_max)
+
+        if channels is None or stats.count is None or not stats.count.any():
+            return None, None, None, None
+        mean, std = stats.mean, stats.std
+        quality = QualityScorer(fs, std, rail_min, rail_max, self.notch_freq)
+
+        # 2️⃣ Clean + filter + store, chunk by chunk
+        sos = design_sos(fs, low, high, order, self.notch_freq, Q)
+        stateful_filter = StatefulSOSFilter(sos, use_float32=self.use_float32)
+        writer = store.create(file_id, channels, fs / self.downsample_factor)
+        carry_raw, carry_clean = None, None
+        num_samples = 0
+        raw_first, raw_stop, raw_parts = 0, 0, []
+        if raw_span_sec is not None:
+            span = min(total_rows, max(1, int(raw_span_sec * fs)))
+            raw_first = (total_rows - span) // 2
+            raw_stop = raw_first + span
+        try:
+            for chunk in open_chunks():
+                chunk = self._drop_ekg(chunk.dropna(how='all'))
+                if chunk.empty:
+                    continue
+                if num_samples < raw_stop and num_samples + len(chunk) > raw_first:
+                    raw_parts.append(chunk.iloc[max(0, raw_first - num_samples):raw_stop - num_samples].copy())
+                chunk = interpolate_with_carry(chunk, carry_raw)
+                carry_raw = chunk.iloc[-1:]
+                quality.update(chunk.to_numpy(dtype=np.float64))
+
+                # Remove extreme outliers (z-score > 5) with the whole-file statistics
+                values = chunk.to_numpy(dtype=np.float64, copy=True)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    values[np.abs((values - mean) / std) > 5] = np.nan
+                cleaned = interpolate_with_carry(pd.DataFrame(values, columns=channels), carry_clean)
+                carry_clean = cleaned.iloc[-1:]
+
+                # Remove DC offset; leading gaps have nothing to interpolate from
+                values = np.nan_to_num(cleaned.to_numpy() - mean)
+                filtered = stateful_filter(values)
+
+                # Keep the downsampling phase continuous across chunks
+                offset = (-num_samples) % self.downsample_factor
+                writer.append(filtered[offset::self.downsample_factor])
+                num_samples += len(filtered)
+        except Exception:
+            writer.abort()
+            raise
+        writer.close()
+
+        metadata = {
+            "num_channels": len(channels),
+            "channels": channels,
+            "num_samples": num_samples,
+            "duration": num_samples / fs,
+        }
+        raw = (raw_first, pd.concat(raw_parts, ignore_index=True)) if raw_parts else None
+        return metadata, fs / self.downsample_factor, quality, raw
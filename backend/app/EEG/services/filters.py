@@ -0,0 +1,49 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, iirnotch, sosfilt, sosfilt_zi, sosfiltfilt, tf2sos
+
+
+@lru_cache(maxsize=32)
+def design_sos(fs, low=0.5, high=40, order=4, notch_freq=50, Q=30):
+    """
+    Band-pass Butterworth followed by a notch, as one cascade of second-order sections.
+    Designed once per (fs, band, notch) and shared by every request.
+    """
+    nyq = 0.5 * fs
+    sos = butter(order, [low / nyq, high / nyq], btype='band', output='sos')
+    if notch_freq and notch_freq < nyq:
+        b, a = iirnotch(notch_freq, Q, fs)
+        sos = np.vstack([sos, tf2sos(b, a)])
+    sos.setflags(write=False)
+    return sos
+
+
+def apply_sos(data, sos, use_float32=False):
+    """Zero-phase filtering of a (samples x channels) matrix in a single axis-wise pass."""
+    dtype = np.float32 if use_float32 else np.float64
+    data = np.asarray(data, dtype=dtype)
+    return sosfiltfilt(sos.astype(dtype), data, axis=0)
+
+
+class StatefulSOSFilter:
+    """
+    Causal version of the same cascade for data that arrives block by block.
+    The filter state is carried from one block to the next, so the output is
+    continuous across block boundaries.
+    """
+
+    def __init__(self, sos, use_float32=False):
+        self.dtype = np.float32 if use_float32 else np.float64
+        self.sos = sos.astype(self.dtype)
+        self.zi = None
+
+    def __call__(self, block):
+        block = np.asarray(block, dtype=self.dtype)
+        if len(block) == 0:
+            return block
+        if self.zi is None:
+            # Start in steady state for the first sample to avoid a step transient
+            self.zi = (sosfilt_zi(self.sos)[:, :, None] * block[0][None, None, :]).astype(self.dtype)
+        out, self.zi = sosfilt(self.sos, block, axis=0, zi=self.zi)
+        return out
@@ -9,106 +9,134 @@ warnings.filterwarnings('ignore')
 SAMPLING_RATE = 200
 PAIRS_LEFT = [('Fp1', 'F7'), ('F7', 'T3'), ('T3', 'T5'), ('T5', 'O1'), ('Fp1', 'F3'), ('F3', 'C3'), ('C3', 'P3'), ('P3', 'O1')]
 PAIRS_RIGHT = [('Fp2', 'F8'), ('F8', 'T4'), ('T4', 'T6'), ('T6', 'O2'), ('Fp2', 'F4'), ('F4', 'C4'), ('C4', 'P4'), ('P4', 'O2')]
+BANDS = {'delta': (0.5, 4), 'theta': (4, 8), 'alpha': (8, 12), 'beta': (12, 30)}
 
-def butter_bandpass_filter(data, lowcut=0.5, highcut=40.0, fs=200, order=5):
+# Per-chain features, in the column order the XGBoost models were trained with
+CHAIN_FEATURES = [
+    'mean', 'var', 'max', 'min', 'zcr',
+    'delta_rel', 'theta_rel', 'alpha_rel', 'beta_rel',
+    'hjorth_mobility', 'hjorth_complexity', 'spectral_entropy',
+    'power_evolution_ratio', 'freq_evolution_abs_diff',
+    'deriv1_var',
+]
+SPATIAL_FEATURES = ['asymmetry', 'cross_corr']
+
+def butter_bandpass_filter(data, lowcut=0.5, highcut=40.0, fs=200, order=5, axis=-1):
     nyq = 0.5 * fs
     b, a = signal.butter(order, [lowcut / nyq, highcut / nyq], btype='band')
-    return signal.filtfilt(b, a, data)
-
-def get_time_stats(chain):
-    return {
-        'mean': np.mean(chain),
-        'var': np.var(chain) + 1e-6,
-        'max': np.max(chain),
-        'min': np.min(chain),
-        'zcr': len(np.where(np.diff(np.sign(chain)))[0]) / len(chain)
-    }
-
-def get_spectral_features(chain, fs=200):
-    features = {}
-    freqs, psd = signal.welch(chain, fs=fs, nperseg=400)
-    bands = {'delta': (0.5, 4), 'theta': (4, 8), 'alpha': (8, 12), 'beta': (12, 30)}
-    total_power = np.sum(psd) + 1e-6
-    for band_name, (low, high) in bands.items():
-        idx_band = np.logical_and(freqs >= low, freqs <= high)
-        features[f'{band_name}_rel'] = np.sum(psd[idx_band]) / total_power
-    return features
-
-def get_evolution_features(chain):
-    half_idx = len(chain) // 2
-    first_half, second_half = chain[:half_idx], chain[half_idx:]
-    
-    var_first, var_second = np.var(first_half), np.var(second_half)
-    power_evolution_ratio = (var_second + 1e-6) / (var_first + 1e-6)
-    
-    freqs1, psd1 = signal.welch(first_half, fs=200, nperseg=400)
-    freqs2, psd2 = signal.welch(second_half, fs=200, nperseg=400)
-    dom_freq1, dom_freq2 = freqs1[np.argmax(psd1)], freqs2[np.argmax(psd2)]
-    
-    return {
-        'power_evolution_ratio': power_evolution_ratio,
-        'freq_evolution_abs_diff': np.abs(dom_freq1 - dom_freq2)
-    }
-
-# --- NEW: PURE NUMPY COMPLEXITY FUNCTION ---
-def get_complexity(chain, fs=200):
-    # 1. Hjorth Parameters
-    var_y = np.var(chain) + 1e-6
-    
-    diff1 = np.diff(chain)
-    var_diff1 = np.var(diff1) + 1e-6
-    mobility = np.sqrt(var_diff1 / var_y)
-    
-    diff2 = np.diff(diff1)
-    var_diff2 = np.var(diff2) + 1e-6
-    mobility_diff = np.sqrt(var_diff2 / var_diff1)
+    return signal.filtfilt(b, a, data, axis=axis)
+
+def build_bipolar_chains(eeg, channels):
+    """
+    eeg: (..., n_samples, n_channels) array with columns named by `channels`.
+    Returns (chain_names, chains) with chains shaped (..., n_chains, n_samples), band-passed.
+    Chains are ordered left/right interleaved, so chains 2i and 2i+1 form a spatial pair.
+    """
+    col = {name: i for i, name in enumerate(channels)}
+    names, plus, minus = [], [], []
+    for p_l, p_r in zip(PAIRS_LEFT, PAIRS_RIGHT):
+        if all(c in col for c in [p_l[0], p_l[1], p_r[0], p_r[1]]):
+            for a, b in (p_l, p_r):
+                names.append(f"{a}-{b}")
+                plus.append(col[a])
+                minus.append(col[b])
+
+    eeg = np.asarray(eeg, dtype=np.float64)
+    chains = np.swapaxes(eeg[..., plus] - eeg[..., minus], -1, -2)
+    return names, butter_bandpass_filter(chains, axis=-1)
+
+def _welch(chains, fs):
+    return signal.welch(chains, fs=fs, nperseg=400, axis=-1)
+
+def compute_chain_features(chains, fs=SAMPLING_RATE):
+    """
+    Every per-chain feature for a stack of chains in one pass.
+    chains: (..., n_chains, n_samples) -> (..., n_chains, len(CHAIN_FEATURES))
+    Welch runs once on the full chains and once on the stacked halves; variances and
+    derivatives are shared between the time statistics, Hjorth and evolution features.
+    """
+    n = chains.shape[-1]
+
+    # 1. Time statistics and derivatives
+    var = np.var(chains, axis=-1)
+    diff1 = np.diff(chains, axis=-1)
+    var_diff1 = np.var(diff1, axis=-1)
+    var_diff2 = np.var(np.diff(diff1, axis=-1), axis=-1)
+    zcr = np.count_nonzero(np.diff(np.sign(chains), axis=-1), axis=-1) / n
+
+    # 2. Spectrum of the full chains -> relative band powers + spectral entropy
+    freqs, psd = _welch(chains, fs)
+    total_power = np.sum(psd, axis=-1) + 1e-6
+    band_rel = [np.sum(psd[..., np.logical_and(freqs >= low, freqs <= high)], axis=-1) / total_power
+                for low, high in BANDS.values()]
+
+    psd_norm = psd / (np.sum(psd, axis=-1, keepdims=True) + 1e-6)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spectral_entropy = -np.sum(np.where(psd_norm > 0, psd_norm * np.log2(psd_norm), 0.0), axis=-1)
+
+    # 3. Hjorth parameters
+    mobility = np.sqrt((var_diff1 + 1e-6) / (var + 1e-6))
+    mobility_diff = np.sqrt((var_diff2 + 1e-6) / (var_diff1 + 1e-6))
     complexity = mobility_diff / (mobility + 1e-6)
-    
-    # 2. Spectral Entropy
-    freqs, psd = signal.welch(chain, fs=fs, nperseg=400)
-    psd_norm = psd / (np.sum(psd) + 1e-6)
-    psd_norm = psd_norm[psd_norm > 0] # Filter out zeros to avoid log(0) error
-    spectral_entropy = -np.sum(psd_norm * np.log2(psd_norm))
-    
-    return {
-        'hjorth_mobility': mobility,
-        'hjorth_complexity': complexity,
-        'spectral_entropy': spectral_entropy
-    }
-
-def get_spatial_features(chain_left, chain_right):
-    corr = np.corrcoef(chain_left, chain_right)[0, 1]
-    return {
-        'asymmetry': np.abs(np.var(chain_left) - np.var(chain_right)),
-        'cross_corr': corr if not np.isnan(corr) else 0
-    }
+
+    # 4. Evolution between the two halves
+    half_idx = n // 2
+    first_half, second_half = chains[..., :half_idx], chains[..., half_idx:]
+    power_evolution_ratio = (np.var(second_half, axis=-1) + 1e-6) / (np.var(first_half, axis=-1) + 1e-6)
+    if first_half.shape[-1] == second_half.shape[-1]:
+        freqs_half, psd_halves = _welch(np.stack([first_half, second_half]), fs)
+        psd1, psd2 = psd_halves[0], psd_halves[1]
+        freqs1 = freqs2 = freqs_half
+    else:
+        freqs1, psd1 = _welch(first_half, fs)
+        freqs2, psd2 = _welch(second_half, fs)
+    freq_evolution = np.abs(freqs1[np.argmax(psd1, axis=-1)] - freqs2[np.argmax(psd2, axis=-1)])
+
+    return np.stack([
+        np.mean(chains, axis=-1), var + 1e-6, np.max(chains, axis=-1), np.min(chains, axis=-1), zcr,
+        *band_rel,
+        mobility, complexity, spectral_entropy,
+        power_evolution_ratio, freq_evolution,
+        var_diff1,
+    ], axis=-1)
+
+def compute_spatial_features(chains):
+    """Left/right pairs (chains 2i, 2i+1): (..., n_chains, n) -> (..., n_chains // 2, 2)"""
+    left, right = chains[..., 0::2, :], chains[..., 1::2, :]
+    asymmetry = np.abs(np.var(left, axis=-1) - np.var(right, axis=-1))
+
+    left_c = left - left.mean(axis=-1, keepdims=True)
+    right_c = right - right.mean(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.sum(left_c * right_c, axis=-1) / np.sqrt(np.sum(left_c ** 2, axis=-1) * np.sum(right_c ** 2, axis=-1))
+    corr = np.nan_to_num(np.clip(corr, -1, 1), nan=0.0)
+    return np.stack([asymmetry, corr], axis=-1)
+
+def feature_columns(chain_names):
+    columns = [f"{name}_{k}" for name in chain_names for k in CHAIN_FEATURES]
+    for name_l, name_r in zip(chain_names[0::2], chain_names[1::2]):
+        columns += [f"{name_l}_vs_{name_r}_{k}" for k in SPATIAL_FEATURES]
+    return columns
+
+def extract_feature_matrix(eeg, channels):
+    """
+    eeg: (n_samples, n_channels) or (n_windows, n_samples, n_channels).
+    Returns a DataFrame with one feature row per window.
+    """
+    eeg = np.asarray(eeg)
+    if eeg.ndim == 2:
+        eeg = eeg[np.newaxis]
+    chain_names, chains = build_bipolar_chains(eeg, channels)
+
+    n_windows = eeg.shape[0]
+    per_chain = compute_chain_features(chains).reshape(n_windows, -1)
+    spatial = compute_spatial_features(chains).reshape(n_windows, -1)
+    return pd.DataFrame(np.hstack([per_chain, spatial]), columns=feature_columns(chain_names))
 
 def preprocess_uploaded_eeg(df):
     """
-    Takes the raw Pandas DataFrame from the FastAPI upload, 
+    Takes the raw Pandas DataFrame from the FastAPI upload,
     creates the bipolar montages, and extracts all features.
     """
     eeg_slice = df.ffill().bfill().fillna(0)
-    
-    signals_dict = {}
-    for p_l, p_r in zip(PAIRS_LEFT, PAIRS_RIGHT):
-        name_l, name_r = f"{p_l[0]}-{p_l[1]}", f"{p_r[0]}-{p_r[1]}"
-        if all(col in eeg_slice.columns for col in [p_l[0], p_l[1], p_r[0], p_r[1]]):
-            signals_dict[name_l] = butter_bandpass_filter(eeg_slice[p_l[0]].values - eeg_slice[p_l[1]].values)
-            signals_dict[name_r] = butter_bandpass_filter(eeg_slice[p_r[0]].values - eeg_slice[p_r[1]].values)
-    
-    row_features = {}
-    for name, data in signals_dict.items():
-        row_features.update({f"{name}_{k}": v for k, v in get_time_stats(data).items()})
-        row_features.update({f"{name}_{k}": v for k, v in get_spectral_features(data).items()})
-        row_features.update({f"{name}_{k}": v for k, v in get_complexity(data).items()})
-        row_features.update({f"{name}_{k}": v for k, v in get_evolution_features(data).items()})
-        row_features[f"{name}_deriv1_var"] = np.var(np.diff(data))
-                
-    for p_left, p_right in zip(PAIRS_LEFT, PAIRS_RIGHT):
-        name_l, name_r = f"{p_left[0]}-{p_left[1]}", f"{p_right[0]}-{p_right[1]}"
-        if name_l in signals_dict and name_r in signals_dict:
-            spatial = get_spatial_features(signals_dict[name_l], signals_dict[name_r])
-            row_features.update({f"{name_l}_vs_{name_r}_{k}": v for k, v in spatial.items()})
-            
-    return pd.DataFrame([row_features])
\ No newline at end of file
+    return extract_feature_matrix(eeg_slice.to_numpy(dtype=np.float64), eeg_slice.columns.tolist())
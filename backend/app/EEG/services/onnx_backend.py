@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import onnxruntime as ort
+from scipy.special import softmax
+
+INPUT_SHAPE = (1, 3, 224, 224)
+
+
+def _is_fresh(path, source_path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+
+def export_to_onnx(torch_model, onnx_path, input_shape=INPUT_SHAPE):
+    """
+    Exports with a dynamic batch axis into a single self-contained .onnx file.
+    Written to a temp file first so a crash never leaves a broken cache behind.
+    """
+    import onnx
+    import torch
+
+    device = next(torch_model.parameters()).device
+    dummy = torch.zeros(input_shape, device=device)
+    export_kwargs = dict(
+        input_names=["input"], output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17,
+    )
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(onnx_path) or ".")
+    try:
+        tmp_path = os.path.join(tmp_dir, "model.onnx")
+        with torch.no_grad():
+            try:
+                # TorchScript exporter: what older torch releases use by default
+                torch.onnx.export(torch_model, dummy, tmp_path, dynamo=False, **export_kwargs)
+            except TypeError:
+                torch.onnx.export(torch_model, dummy, tmp_path, **export_kwargs)
+        # Re-save so weights are embedded even if the exporter used external data files
+        onnx.save(onnx.load(tmp_path), tmp_path + ".single")
+        os.replace(tmp_path + ".single", onnx_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def quantize_onnx(onnx_path, int8_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = int8_path + ".tmp"
+    quantize_dynamic(onnx_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, int8_path)
+
+
+class OnnxDLBackend:
+    """
+    CPU inference for the EEG EfficientNetV2 through onnxruntime.
+    The loaded PyTorch model is exported once to <weights>.onnx (and <weights>.int8.onnx
+    when quantizing) next to the .pth file; later starts reuse the cached files until the
+    weights change.
+    """
+
+    def __init__(self, torch_model, weights_path, quantize=False, num_threads=None):
+        base_path = os.path.splitext(weights_path)[0]
+        self.model_path = base_path + ".onnx"
+        if not _is_fresh(self.model_path, weights_path):
+            print(" Exporting DL model to ONNX...")
+            export_to_onnx(torch_model, self.model_path)
+
+        if quantize:
+            int8_path = base_path + ".int8.onnx"
+            if not _is_fresh(int8_path, self.model_path):
+                quantize_onnx(self.model_path, int8_path)
+            self.model_path = int8_path
+        self.quantized = quantize
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = num_threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        self.warm_up()
+
+    def warm_up(self, runs=2):
+        """First runs pay for memory planning and kernel selection; do it before the first request."""
+        dummy = np.zeros(INPUT_SHAPE, dtype=np.float32)
+        for _ in range(runs):
+            self.session.run(None, {self.input_name: dummy})
+
+    def predict_proba(self, batch):
+        """batch: (n, 3, 224, 224) array or tensor -> (n, n_classes) softmax probabilities"""
+        if hasattr(batch, "detach"):
+            batch = batch.detach().cpu().numpy()
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        logits = self.session.run(None, {self.input_name: batch})[0]
+        return softmax(logits, axis=1)
+
+    def check_parity(self, torch_model, atol=None, batch_size=2):
+        """Max abs difference of softmax outputs against PyTorch on a random batch (raises above atol)."""
+        import torch
+
+        if atol is None:
+            atol = 5e-2 if self.quantized else 1e-4
+        batch = np.random.default_rng(0).random((batch_size,) + INPUT_SHAPE[1:], dtype=np.float32)
+        device = next(torch_model.parameters()).device
+        with torch.no_grad():
+            expected = torch.softmax(torch_model(torch.from_numpy(batch).to(device)), dim=1).cpu().numpy()
+        diff = float(np.max(np.abs(self.predict_proba(batch) - expected)))
+        if diff > atol:
+            raise AssertionError(f"ONNX DL backend deviates from PyTorch by {diff:.3g}")
+        return diff
@@ -1,12 +1,16 @@
-import xgboost as xgb
 import numpy as np
 import os
+import pandas as pd
+from math import gcd
+from scipy.signal import resample_poly
 import torch
 import torch.nn.functional as F
 from torchvision.models import efficientnet_v2_s
 
-from app.EEG.services.ml_feature_logic import preprocess_uploaded_eeg
-from app.EEG.services.dl_feature_logic import preprocess_eeg_for_dl
+from app.EEG.services.ml_feature_logic import SAMPLING_RATE, extract_feature_matrix, preprocess_uploaded_eeg
+from app.EEG.services.dl_feature_logic import middle_window, preprocess_eeg_for_dl, preprocess_eeg_windows_for_dl, to_feats_order
+from app.EEG.services.ensemble import XGBFoldEnsemble
+from app.EEG.services.onnx_backend import OnnxDLBackend
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 ML_MODEL_DIR = os.path.join(CURRENT_DIR, "..", "models", "ml")
@@ -14,20 +18,28 @@ ML_MODEL_DIR = os.path.join(CURRENT_DIR, "..", "models", "ml")
 # 1. FIX THE DL MODEL FILENAME HERE:
 DL_MODEL_PATH = os.path.join(CURRENT_DIR, "..", "models", "dl", "EfficientNetV2_S_Spect_Model_FromScratch_v1 (2).pth")
 
+# "torch" (eager PyTorch) or "onnx" (onnxruntime, optionally int8-quantized)
+DL_BACKEND = os.environ.get("EEG_DL_BACKEND", "torch")
+DL_QUANTIZE = os.environ.get("EEG_DL_QUANTIZE", "0") == "1"
+
+def resample_to_model_rate(x, sampling_rate, axis=0):
+    """Both models were trained on 200Hz recordings; other rates are polyphase-resampled."""
+    if sampling_rate == SAMPLING_RATE:
+        return x
+    up, down = int(SAMPLING_RATE), int(round(sampling_rate))
+    g = gcd(up, down)
+    return resample_poly(x, up // g, down // g, axis=axis)
+
 class AiPredictor:
-    def __init__(self):
+    def __init__(self, dl_backend=DL_BACKEND, quantize=DL_QUANTIZE):
         self.classes = ["Seizure", "LPD", "GPD", "LRDA", "GRDA", "Other"]
         
         # --- 1. LOAD ML MODELS (XGBoost) ---
-        self.ml_models = []
+        self.ml_models = None
         try:
-            for i in range(5):
-                # 2. FIX THE ML MODEL FILENAME HERE:
-                path = os.path.join(ML_MODEL_DIR, f"xgb_model_foldFinal_{i}.json")
-                if os.path.exists(path):
-                    model = xgb.XGBRegressor()
-                    model.load_model(path)
-                    self.ml_models.append(model)
+            # 2. FIX THE ML MODEL FILENAME HERE:
+            paths = [os.path.join(ML_MODEL_DIR, f"xgb_model_foldFinal_{i}.json") for i in range(5)]
+            self.ml_models = XGBFoldEnsemble(paths)
             print(f" Loaded {len(self.ml_models)} ML models.")
         except Exception as e:
             print(f" Error loading ML models: {e}")
@@ -57,7 +69,36 @@ class AiPredictor:
         except Exception as e:
             print(f" Error loading DL model: {e}")
 
-    def predict(self, df):
+        # --- 3. OPTIONAL ONNX RUNTIME BACKEND (falls back to PyTorch on any problem)
+        self.dl_onnx = None
+        if self.dl_model is not None and dl_backend == "onnx":
+            try:
+                backend = OnnxDLBackend(self.dl_model, DL_MODEL_PATH, quantize=quantize)
+                diff = backend.check_parity(self.dl_model)
+                self.dl_onnx = backend
+                print(f" ONNX DL backend ready (max diff vs PyTorch {diff:.1e}).")
+            except Exception as e:
+                print(f"⚠️ ONNX DL backend unavailable, using PyTorch: {e}")
+
+    def predict_ml_batch(self, feature_rows):
+        """(n_rows, n_features) -> (n_rows, 6) fold-averaged probabilities in self.classes order"""
+        return self.ml_models.predict(feature_rows)
+
+    def predict_dl_batch(self, tensor_batch):
+        """(n, 3, 224, 224) -> (n, 6) softmax probabilities in self.classes order"""
+        if self.dl_onnx is not None:
+            probabilities = self.dl_onnx.predict_proba(tensor_batch)
+        else:
+            with torch.no_grad():
+                logits = self.dl_model(tensor_batch.to(self.device))
+                probabilities = F.softmax(logits, dim=1).cpu().numpy()
+        order = [self.dl_training_classes.index(c) for c in self.classes]
+        return probabilities[:, order]
+
+    def predict(self, df, sampling_rate=SAMPLING_RATE):
+        if sampling_rate != SAMPLING_RATE:
+            df = pd.DataFrame(resample_to_model_rate(df.to_numpy(dtype=np.float64), sampling_rate), columns=df.columns)
+
         ml_results = {c: 0.0 for c in self.classes}
         dl_results = {c: 0.0 for c in self.classes}
 
@@ -65,16 +106,7 @@ class AiPredictor:
         if self.ml_models:
             try:
                 ml_input = preprocess_uploaded_eeg(df)
-                ml_preds = np.zeros((1, 6))
-                for model in self.ml_models:
-                    for model in self.ml_models:
-                    # Adding .values prevents feature_name mismatch errors
-                        pred = model.predict(ml_input.values) 
-                        pred = np.clip(pred, 1e-15, 1.0)
-                    pred = pred / np.sum(pred, axis=1, keepdims=True)
-                    ml_preds += pred
-                
-                ml_final = ml_preds / len(self.ml_models)
+                ml_final = self.predict_ml_batch(ml_input.values)
                 ml_results = dict(zip(self.classes, np.round(ml_final[0], 4).tolist()))
             except Exception as e:
                 print(f"⚠️ ML Prediction failed: {e}")
@@ -83,26 +115,47 @@ class AiPredictor:
         if self.dl_model:
             try:
                 tensor_input = preprocess_eeg_for_dl(df)
-                tensor_input = tensor_input.to(self.device)
-
-                with torch.no_grad():
-                    logits = self.dl_model(tensor_input)
-                    probabilities = F.softmax(logits, dim=1).cpu().numpy()[0]
-
-                raw_dl_dict = dict(zip(self.dl_training_classes, probabilities))
-
-                dl_results = {
-                    "Seizure": round(float(raw_dl_dict["Seizure"]), 4),
-                    "LPD": round(float(raw_dl_dict["LPD"]), 4),
-                    "GPD": round(float(raw_dl_dict["GPD"]), 4),
-                    "LRDA": round(float(raw_dl_dict["LRDA"]), 4),
-                    "GRDA": round(float(raw_dl_dict["GRDA"]), 4),
-                    "Other": round(float(raw_dl_dict["Other"]), 4),
-                }
+                probabilities = self.predict_dl_batch(tensor_input)[0]
+                dl_results = {c: round(float(p), 4) for c, p in zip(self.classes, probabilities)}
             except Exception as e:
                 print(f"⚠️ DL Prediction failed: {e}")
 
         return {
             "ML_Predictions": ml_results,
             "DL_Predictions": dl_results
-        }
\ No newline at end of file
+        }
+
+    def predict_windows(self, windows, channels, sampling_rate=SAMPLING_RATE):
+        """
+        Both models on a batch of windows in one pass each.
+        windows: (n_windows, n_samples, n_channels) with columns named by `channels`.
+        Returns {"ML_Predictions": (n, 6), "DL_Predictions": (n, 6)} in self.classes order;
+        a model that is unavailable or fails yields zeros, like predict().
+        """
+        windows = np.asarray(windows, dtype=np.float64)
+        n_windows = len(windows)
+        ml_probs = np.zeros((n_windows, len(self.classes)))
+        dl_probs = np.zeros((n_windows, len(self.classes)))
+
+        windows = resample_to_model_rate(windows, sampling_rate, axis=1)
+
+        # --- ML PREDICTION ---
+        if self.ml_models:
+            try:
+                features = extract_feature_matrix(windows, channels)
+                ml_probs = self.predict_ml_batch(features.values)
+            except Exception as e:
+                print(f"⚠️ ML Prediction failed: {e}")
+
+        # --- DL PREDICTION ---
+        if self.dl_model:
+            try:
+                # Same 10 second focus as predict(); the montage indexes channels by
+                # FEATS position, so reorder by name
+                centered = np.swapaxes(middle_window(np.swapaxes(windows, 0, 1)), 0, 1)
+                dl_windows = to_feats_order(centered, channels)
+                dl_probs = self.predict_dl_batch(preprocess_eeg_windows_for_dl(dl_windows))
+            except Exception as e:
+                print(f"⚠️ DL Prediction failed: {e}")
+
+        return {"ML_Predictions": ml_probs, "DL_Predictions": dl_probs}
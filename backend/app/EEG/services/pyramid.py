@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+# Level 0 summarizes 8 samples per bucket, every following level 4x more.
+BASE_BUCKET = 8
+LEVEL_FACTOR = 4
+BUILD_CHUNK_BUCKETS = 65536
+
+
+def level_file(bucket):
+    return f"minmax_{bucket}.f32"
+
+
+def _reduce(mins, maxs, k):
+    """Min/max over consecutive groups of k rows; a trailing partial group is kept."""
+    n_full = (len(mins) // k) * k
+    num_channels = mins.shape[1]
+    out_min = mins[:n_full].reshape(-1, k, num_channels).min(axis=1)
+    out_max = maxs[:n_full].reshape(-1, k, num_channels).max(axis=1)
+    if n_full < len(mins):
+        out_min = np.vstack([out_min, mins[n_full:].min(axis=0, keepdims=True)])
+        out_max = np.vstack([out_max, maxs[n_full:].max(axis=0, keepdims=True)])
+    return out_min, out_max
+
+
+def build_pyramid(signals, out_dir):
+    """
+    Writes one (n_buckets, 2, n_channels) float32 min/max file per level into out_dir.
+    The raw matrix is read in chunks, so building works straight off a memmap.
+    Returns the list of bucket sizes that were written.
+    """
+    num_samples = signals.shape[0]
+    if num_samples <= BASE_BUCKET:
+        return []
+
+    # 1. Level 0 from the raw samples
+    chunk_rows = BASE_BUCKET * BUILD_CHUNK_BUCKETS
+    mins, maxs = [], []
+    for start in range(0, num_samples, chunk_rows):
+        block = np.asarray(signals[start:start + chunk_rows], dtype=np.float32)
+        level_min, level_max = _reduce(block, block, BASE_BUCKET)
+        mins.append(level_min)
+        maxs.append(level_max)
+    level_min, level_max = np.vstack(mins), np.vstack(maxs)
+
+    # 2. Coarser levels from the previous one until a single bucket covers everything
+    buckets = []
+    bucket = BASE_BUCKET
+    while True:
+        np.stack([level_min, level_max], axis=1).astype("<f4").tofile(os.path.join(out_dir, level_file(bucket)))
+        buckets.append(bucket)
+        if len(level_min) <= 1:
+            break
+        level_min, level_max = _reduce(level_min, level_max, LEVEL_FACTOR)
+        bucket *= LEVEL_FACTOR
+    return buckets
+
+
+def pick_bucket(buckets, num_samples, width):
+    """Finest level that still fits the range into at most `width` buckets (1 = raw samples)."""
+    if num_samples <= 2 * width or not buckets:
+        return 1
+    for bucket in buckets:
+        if -(-num_samples // bucket) <= width:
+            return bucket
+    return buckets[-1]
+
+
+def open_level(session_dir, bucket, num_samples, num_channels):
+    num_buckets = -(-num_samples // bucket)
+    return np.memmap(
+        os.path.join(session_dir, level_file(bucket)),
+        dtype="<f4", mode="r", shape=(num_buckets, 2, num_channels),
+    )
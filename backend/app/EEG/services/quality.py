@@ -0,0 +1,181 @@
+import json
+import os
+
+import numpy as np
+import scipy.fft
+
+from app.EEG.services.streaming import RunningStats
+
+WINDOW_SEC = 1.0            # one quality verdict per channel per second
+SECONDS_PER_CHUNK = 900     # windows scored per FFT call; bounds scratch memory
+
+FLAGS = ("flatline", "clipping", "line_noise", "high_amplitude", "muscle")
+FLATLINE, CLIPPING, LINE_NOISE, HIGH_AMPLITUDE, MUSCLE = (1 << i for i in range(len(FLAGS)))
+
+# Amplitude thresholds are relative to each channel's whole-recording std, so they do not
+# depend on the units of the upload (CSV files carry none)
+FLAT_STD_RATIO = 0.01       # window std under 1% of the channel std
+HIGH_AMP_STD_RATIO = 12.0   # window peak-to-peak over 12 channel stds
+CLIP_FRACTION = 0.05        # over 5% of the window sitting on the channel's min or max
+LINE_RATIO = 0.5            # mains +/- 1 Hz holds over half of the power above 1 Hz
+MUSCLE_LOW = 30.0           # EMG band starts here and runs to Nyquist (mains excluded)
+MUSCLE_RATIO = 0.35
+
+QUALITY_FILE = "quality.u1"
+QUALITY_META_FILE = "quality.json"
+
+
+def score_windows(windows, fs, ref_std, rail_min, rail_max, line_freq=50):
+    """
+    Flag bits of every (window, channel) pair at once.
+    windows: (n_windows, window_len, n_channels). ref_std / rail_min / rail_max are the
+    per-channel std, minimum and maximum over the whole recording.
+    Returns (n_windows, n_channels) uint8, one bit per entry of FLAGS.
+    """
+    windows = np.nan_to_num(np.asarray(windows, dtype=np.float64))
+    flags = np.zeros((windows.shape[0], windows.shape[2]), dtype=np.uint8)
+
+    # Amplitude statistics
+    std = windows.std(axis=1)
+    ptp = np.ptp(windows, axis=1)
+    with np.errstate(invalid="ignore"):
+        flags[(std <= FLAT_STD_RATIO * ref_std) | (ptp == 0)] |= FLATLINE
+        flags[ptp > HIGH_AMP_STD_RATIO * ref_std] |= HIGH_AMPLITUDE
+
+    # Clipping: a real extreme is hit once, a saturated amplifier sits on the rail
+    span = rail_max - rail_min
+    tol = 1e-6 * np.where(np.isfinite(span) & (span > 0), span, 0.0)
+    on_rail = (windows >= rail_max - tol) | (windows <= rail_min + tol)
+    flags[(on_rail.mean(axis=1) > CLIP_FRACTION) & (span > 0)] |= CLIPPING
+
+    # Spectral ratios from one real FFT per window (1 Hz bins for 1 s windows)
+    length = windows.shape[1]
+    freqs = scipy.fft.rfftfreq(length, 1 / fs)
+    power = np.abs(scipy.fft.rfft(windows - windows.mean(axis=1, keepdims=True), axis=1, workers=-1)) ** 2
+    line_band = np.zeros(len(freqs), dtype=bool)
+    if line_freq and line_freq < fs / 2:
+        line_band = np.abs(freqs - line_freq) <= 1.0
+    total = power[:, freqs >= 1.0].sum(axis=1)
+    line = power[:, line_band].sum(axis=1)
+    muscle = power[:, (freqs >= MUSCLE_LOW) & ~line_band].sum(axis=1)
+    flags[(total > 0) & (line > LINE_RATIO * total)] |= LINE_NOISE
+    flags[(total > 0) & (muscle > MUSCLE_RATIO * total)] |= MUSCLE
+    return flags
+
+
+class QualityScorer:
+    """
+    Scores a recording fed as consecutive (samples x channels) blocks, one window per second.
+    The incomplete tail of a block is carried into the next, so the windows do not depend on
+    how the recording was chunked; a trailing partial second is not scored.
+    """
+
+    def __init__(self, fs, ref_std, rail_min, rail_max, line_freq=50, window_sec=WINDOW_SEC):
+        self.fs = fs
+        self.window = max(1, int(round(window_sec * fs)))
+        self.window_sec = self.window / fs
+        self.ref_std = np.asarray(ref_std, dtype=np.float64)
+        self.rail_min = np.asarray(rail_min, dtype=np.float64)
+        self.rail_max = np.asarray(rail_max, dtype=np.float64)
+        self.line_freq = line_freq
+        self._carry = None
+        self._masks = []
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if self._carry is not None:
+            block = np.concatenate([self._carry, block])
+        n_windows = len(block) // self.window
+        for first in range(0, n_windows, SECONDS_PER_CHUNK):
+            last = min(first + SECONDS_PER_CHUNK, n_windows)
+            windows = block[first * self.window:last * self.window].reshape(last - first, self.window, -1)
+            self._masks.append(score_windows(windows, self.fs, self.ref_std, self.rail_min,
+                                             self.rail_max, self.line_freq))
+        self._carry = block[n_windows * self.window:]
+
+    def finish(self):
+        """(n_windows, n_channels) uint8 flag bits."""
+        if not self._masks:
+            return np.zeros((0, len(self.ref_std)), dtype=np.uint8)
+        return np.concatenate(self._masks)
+
+
+def rail_limits(block):
+    """Per-channel min / max ignoring NaNs (+inf / -inf for an all-NaN channel)."""
+    block = np.asarray(block, dtype=np.float64)
+    return np.fmin.reduce(block, axis=0, initial=np.inf), np.fmax.reduce(block, axis=0, initial=-np.inf)
+
+
+def score_recording(values, fs, line_freq=50, window_sec=WINDOW_SEC):
+    """Whole (samples x channels) matrix in memory -> QualityScorer with every window scored."""
+    stats = RunningStats()
+    stats.update(values)
+    rail_min, rail_max = rail_limits(values)
+    scorer = QualityScorer(fs, stats.std, rail_min, rail_max, line_freq, window_sec)
+    scorer.update(values)
+    return scorer
+
+
+def summarize(mask, channels, window_sec):
+    """
+    Compact per-channel report: the share of flagged windows, windows per flag, and the
+    flagged stretches run-length encoded as [start_sec, end_sec, flag_bits].
+    """
+    counts = ((mask[:, :, np.newaxis] >> np.arange(len(FLAGS), dtype=np.uint8)) & 1).sum(axis=0)
+    report = {}
+    for i, ch in enumerate(channels):
+        col = mask[:, i]
+        change = np.flatnonzero(np.diff(col)) + 1
+        starts = np.concatenate([[0], change])
+        ends = np.concatenate([change, [len(col)]])
+        keep = col[starts] != 0 if len(col) else np.zeros(0, dtype=bool)
+        report[ch] = {
+            "bad_fraction": round(float(np.mean(col != 0)), 4) if len(col) else 0.0,
+            "flag_windows": {flag: int(counts[i, k]) for k, flag in enumerate(FLAGS)},
+            "segments": [[s * window_sec, e * window_sec, int(col[s])] for s, e in zip(starts[keep], ends[keep])],
+        }
+    return {
+        "window_sec": window_sec,
+        "num_windows": len(mask),
+        "flags": list(FLAGS),
+        "channels": report,
+    }
+
+
+def save_quality(store, file_id, mask, window_sec):
+    """Writes the mask next to the session signals; quality.json is written last."""
+    path = store.session_path(file_id, QUALITY_FILE)
+    meta_path = store.session_path(file_id, QUALITY_META_FILE)
+    tmp = f".{os.getpid()}.tmp"
+    with open(path + tmp, "wb") as f:
+        f.write(np.ascontiguousarray(mask, dtype=np.uint8).tobytes())
+    os.replace(path + tmp, path)
+    with open(meta_path + tmp, "w") as f:
+        json.dump({"window_sec": window_sec, "num_windows": len(mask), "flags": list(FLAGS)}, f)
+    os.replace(meta_path + tmp, meta_path)
+    store.notify_written()
+
+
+def load_quality(store, file_id, num_channels):
+    """(info, mask) of a session, or (None, None) when it was stored without a quality mask."""
+    meta_path = store.session_path(file_id, QUALITY_META_FILE)
+    if not os.path.exists(meta_path):
+        return None, None
+    with open(meta_path, "r") as f:
+        info = json.load(f)
+    mask = np.fromfile(store.session_path(file_id, QUALITY_FILE), dtype=np.uint8)
+    return info, mask.reshape(info["num_windows"], num_channels)
+
+
+def window_bad_fraction(mask, window_sec, t_start, t_end):
+    """
+    Share of flagged (second, channel) cells covered by each analysis window [t_start, t_end)
+    (seconds, arrays); cells past the scored part of the recording count as clean.
+    """
+    n = len(mask)
+    bad_per_window = np.concatenate([[0], np.cumsum((mask != 0).sum(axis=1))])
+    first = np.clip(np.floor(np.asarray(t_start) / window_sec).astype(int), 0, n)
+    last = np.clip(np.ceil(np.asarray(t_end) / window_sec).astype(int), 0, n)
+    cells = (last - first) * max(mask.shape[1], 1)
+    bad = bad_per_window[last] - bad_per_window[first]
+    return np.divide(bad, cells, out=np.zeros(len(first)), where=cells > 0)
@@ -0,0 +1,298 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from app.EEG.services.pyramid import build_pyramid, open_level, pick_bucket
+
+DTYPE = np.dtype("<f4")
+META_FILE = "meta.json"
+SIGNALS_FILE = "signals.f32"
+
+
+class SessionWriter:
+    """Appends row blocks (samples x channels) to a session that is still being written."""
+
+    def __init__(self, store, file_id, channels, sampling_rate, extra_meta=None):
+        self.store = store
+        self.file_id = file_id
+        self.channels = list(channels)
+        self.sampling_rate = float(sampling_rate)
+        self.extra_meta = dict(extra_meta or {})
+        self.num_samples = 0
+
+        self.tmp_dir = store._session_dir(file_id) + ".tmp"
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._fh = open(os.path.join(self.tmp_dir, SIGNALS_FILE), "wb")
+
+    def append(self, block):
+        block = np.ascontiguousarray(block, dtype=DTYPE)
+        if block.ndim != 2 or block.shape[1] != len(self.channels):
+            raise ValueError(f"Expected a (n, {len(self.channels)}) block, got {block.shape}")
+        self._fh.write(block.tobytes())
+        self.num_samples += block.shape[0]
+
+    def add_file(self, name, array):
+        """Stores an array next to the signals (e.g. a time column); published with them."""
+        np.ascontiguousarray(array).tofile(os.path.join(self.tmp_dir, name))
+
+    def close(self):
+        """Builds the zoom pyramid, writes the header and publishes the session; readers never see a half-written one."""
+        self._fh.close()
+        buckets = []
+        if self.num_samples:
+            signals = np.memmap(
+                os.path.join(self.tmp_dir, SIGNALS_FILE), dtype=DTYPE, mode="r",
+                shape=(self.num_samples, len(self.channels)),
+            )
+            buckets = build_pyramid(signals, self.tmp_dir)
+            del signals
+
+        meta = {
+            "channels": self.channels,
+            "sampling_rate": self.sampling_rate,
+            "num_samples": self.num_samples,
+            "dtype": DTYPE.str,
+            "pyramid": buckets,
+            "created_at": time.time(),
+            **self.extra_meta,
+        }
+        with open(os.path.join(self.tmp_dir, META_FILE), "w") as f:
+            json.dump(meta, f)
+
+        final_dir = self.store._session_dir(self.file_id)
+        if os.path.exists(final_dir):
+            shutil.rmtree(final_dir)
+        os.replace(self.tmp_dir, final_dir)
+        self.store.notify_written()
+        return meta
+
+    def abort(self):
+        self._fh.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class SessionStore:
+    """
+    Keeps every analysed recording (EEG sessions, ECG records) on disk as one directory per session:
+      meta.json   -> channels, sampling rate, number of samples
+      signals.f32 -> little-endian float32 matrix of shape (num_samples, num_channels)
+      minmax_<bucket>.f32 -> min/max pyramid levels used for zoomed-out viewports
+      (callers may add files next to these: an ECG time column, the band-power tiles, ...)
+    Rows are contiguous, so a page read only touches the requested sample range.
+
+    Sessions are evicted once unused for ttl_seconds, and least recently used first
+    while the store is above max_bytes. The mtime of meta.json is the last-access
+    time (touched on every read), so several workers sharing the directory agree on it.
+    Sessions written less than grace_seconds ago are never evicted for the quota: the
+    request that created one is still adding to it (quality mask) and returning its id.
+    """
+
+    def __init__(self, root, ttl_seconds=None, max_bytes=None, grace_seconds=60.0):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        os.makedirs(self.root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sweeper = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes_evicted": 0}
+
+    def _session_dir(self, file_id):
+        # file ids are uuids we generated; anything else cannot name a session
+        try:
+            file_id = str(uuid.UUID(str(file_id)))
+        except ValueError:
+            raise KeyError(file_id)
+        return os.path.join(self.root, file_id)
+
+    def exists(self, file_id):
+        """Looks a session up for a request; a hit also marks it as recently used."""
+        try:
+            found = self._touch(os.path.join(self._session_dir(file_id), META_FILE))
+        except KeyError:
+            found = False
+        with self._lock:
+            self.stats["hits" if found else "misses"] += 1
+        return found
+
+    def _touch(self, meta_path):
+        try:
+            os.utime(meta_path)
+            return True
+        except OSError:
+            return False
+
+    def create(self, file_id, channels, sampling_rate, extra_meta=None):
+        return SessionWriter(self, file_id, channels, sampling_rate, extra_meta)
+
+    def save(self, file_id, matrix, channels, sampling_rate, extra_meta=None, extra_files=None):
+        """extra_meta: more meta.json fields; extra_files: {name: array} stored with the signals."""
+        writer = self.create(file_id, channels, sampling_rate, extra_meta)
+        try:
+            writer.append(matrix)
+            for name, array in (extra_files or {}).items():
+                writer.add_file(name, array)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.close()
+
+    def notify_written(self):
+        """
+        Called after a session or a cache derived from it (band power, quality mask) is written:
+        the store may now be over its quota, which the sweeper deals with.
+        """
+        if self.max_bytes is not None:
+            self._wake.set()
+
+    def session_path(self, file_id, name):
+        """Path of a file inside a session directory (for caches derived from the signals)."""
+        return os.path.join(self._session_dir(file_id), name)
+
+    def load_meta(self, file_id):
+        path = os.path.join(self._session_dir(file_id), META_FILE)
+        if not os.path.exists(path):
+            raise KeyError(file_id)
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def open_signals(self, file_id, meta=None):
+        """Memory-maps the whole session matrix read-only (nothing is read until sliced)."""
+        meta = meta or self.load_meta(file_id)
+        path = os.path.join(self._session_dir(file_id), SIGNALS_FILE)
+        shape = (meta["num_samples"], len(meta["channels"]))
+        if meta["num_samples"] == 0:
+            return np.zeros(shape, dtype=DTYPE)
+        return np.memmap(path, dtype=np.dtype(meta["dtype"]), mode="r", shape=shape)
+
+    def read_rows(self, file_id, start, end):
+        meta = self.load_meta(file_id)
+        signals = self.open_signals(file_id, meta)
+        start = max(0, min(start, meta["num_samples"]))
+        end = max(start, min(end, meta["num_samples"]))
+        return meta, np.asarray(signals[start:end])
+
+    def read_viewport(self, file_id, start, end, width):
+        """
+        Returns (meta, bucket, times, block) for samples [start, end) decimated to at most
+        ~2*width rows. bucket == 1 means raw samples; otherwise every bucket contributes its
+        min and max row so spikes survive any zoom level.
+        """
+        meta = self.load_meta(file_id)
+        num_samples = meta["num_samples"]
+        start = max(0, min(start, num_samples))
+        end = max(start, min(end, num_samples))
+        sampling_rate = meta["sampling_rate"]
+
+        bucket = pick_bucket(meta.get("pyramid", []), end - start, width)
+        if bucket == 1:
+            block = np.asarray(self.open_signals(file_id, meta)[start:end])
+            times = np.arange(start, end) / sampling_rate
+            return meta, bucket, times, block
+
+        level = open_level(self._session_dir(file_id), bucket, num_samples, len(meta["channels"]))
+        first, last = start // bucket, -(-end // bucket)
+        block = np.asarray(level[first:last]).reshape(-1, len(meta["channels"]))
+        centers = (np.arange(first, last) * bucket + bucket / 2) / sampling_rate
+        times = np.repeat(centers, 2)
+        return meta, bucket, times, block
+
+    def delete(self, file_id):
+        shutil.rmtree(self._session_dir(file_id), ignore_errors=True)
+
+    # ---------------- EVICTION ----------------
+    def _scan(self):
+        """(file_id, last_access, bytes, written_at) for every published session."""
+        sessions = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.name.endswith(".tmp"):
+                continue
+            try:
+                last_access = os.stat(os.path.join(entry.path, META_FILE)).st_mtime
+                # signals.f32 is written once, before the session is published
+                written_at = os.stat(os.path.join(entry.path, SIGNALS_FILE)).st_mtime
+                size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            except OSError:
+                continue
+            sessions.append((entry.name, last_access, size, written_at))
+        return sessions
+
+    def _remove(self, path):
+        size = 0
+        if os.path.isdir(path):
+            size = sum(f.stat().st_size for f in os.scandir(path) if f.is_file())
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            size = os.path.getsize(path)
+            os.remove(path)
+        with self._lock:
+            self.stats["evictions"] += 1
+            self.stats["bytes_evicted"] += size
+
+    def sweep(self, now=None):
+        """Deletes expired sessions, then least recently used ones until under quota."""
+        now = now or time.time()
+        ttl = self.ttl_seconds
+
+        # Leftovers: JSON sessions from the old format and writes that never finished
+        for entry in os.scandir(self.root):
+            stale = entry.name.endswith(".json") or entry.name.endswith(".tmp")
+            if stale and ttl is not None and now - entry.stat().st_mtime > ttl:
+                self._remove(entry.path)
+
+        sessions = sorted(self._scan(), key=lambda s: s[1])
+        kept = []
+        for file_id, last_access, size, written_at in sessions:
+            if ttl is not None and now - last_access > ttl:
+                self._remove(os.path.join(self.root, file_id))
+            else:
+                kept.append((file_id, size, written_at))
+
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in kept)
+            for file_id, size, written_at in kept:
+                if total <= self.max_bytes:
+                    break
+                if now - written_at < self.grace_seconds:
+                    continue  # still being finalised by its request; counted, not evicted
+                self._remove(os.path.join(self.root, file_id))
+                total -= size
+
+    def start_sweeper(self, interval_seconds=300):
+        """Runs sweep() on a daemon thread so eviction never blocks request handling."""
+        if self._sweeper is not None:
+            return
+
+        def _loop():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"⚠️ Session sweep failed: {e}")
+                self._wake.wait(interval_seconds)
+                self._wake.clear()
+
+        name = f"{os.path.basename(os.path.normpath(self.root))}-sweeper"
+        self._sweeper = threading.Thread(target=_loop, name=name, daemon=True)
+        self._sweeper.start()
+
+    def get_stats(self):
+        sessions = self._scan()
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "sessions": len(sessions),
+            "bytes_used": sum(size for _, _, size, _ in sessions),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+        })
+        return stats
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+def iter_csv_chunks(fileobj, chunk_rows):
+    fileobj.seek(0)
+    with pd.read_csv(fileobj, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def iter_parquet_chunks(fileobj, chunk_rows):
+    import pyarrow.parquet as pq
+
+    fileobj.seek(0)
+    parquet_file = pq.ParquetFile(fileobj)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def chunk_reader(filename, fileobj, chunk_rows):
+    """Returns a callable that restarts the record-batch iteration (the upload is read twice)."""
+    if filename.endswith(".parquet"):
+        return lambda: iter_parquet_chunks(fileobj, chunk_rows)
+    return lambda: iter_csv_chunks(fileobj, chunk_rows)
+
+
+class RunningStats:
+    """Per-channel mean / sample std merged chunk by chunk (Chan et al.), NaNs ignored."""
+
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        valid = ~np.isnan(block)
+        n = valid.sum(axis=0)
+        total = np.where(valid, block, 0.0).sum(axis=0)
+        mean = np.divide(total, n, out=np.zeros_like(total), where=n > 0)
+        m2 = np.where(valid, (block - mean) ** 2, 0.0).sum(axis=0)
+
+        if self.count is None:
+            self.count, self.mean, self.m2 = n, mean, m2
+            return
+
+        combined = self.count + n
+        delta = mean - self.mean
+        weight = np.divide(n, combined, out=np.zeros_like(delta), where=combined > 0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * weight
+        self.count = combined
+
+    @property
+    def std(self):
+        return np.sqrt(np.divide(self.m2, self.count - 1, out=np.full_like(self.m2, np.nan), where=self.count > 1))
+
+
+def interpolate_with_carry(df, carry):
+    """Linear interpolation that continues from the last row of the previous chunk."""
+    if carry is None:
+        return df.interpolate(method="linear")
+    joined = pd.concat([carry, df])
+    return joined.interpolate(method="linear").iloc[1:]
@@ -0,0 +1,57 @@
+import json
+import struct
+
+import numpy as np
+
+BINARY_MEDIA_TYPE = "application/octet-stream"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def negotiate(accept):
+    """Media type to answer with for an Accept header; JSON unless a binary type is asked for."""
+    accept = (accept or "").lower()
+    if ARROW_MEDIA_TYPE in accept:
+        return ARROW_MEDIA_TYPE
+    if BINARY_MEDIA_TYPE in accept:
+        return BINARY_MEDIA_TYPE
+    return "application/json"
+
+
+def encode_binary(times, block, channels, **header_fields):
+    """
+    Layout (all little-endian):
+      uint32       header length in bytes
+      header       UTF-8 JSON, space padded so the data section starts 8-byte aligned
+      time block   float64[num_rows]
+      signal block float32[num_rows, num_channels], row-major
+    Offsets in the header are relative to the start of the data section, so a browser can
+    wrap both blocks in Float64Array / Float32Array views without copying.
+    """
+    times = np.ascontiguousarray(times, dtype="<f8")
+    block = np.ascontiguousarray(block, dtype="<f4")
+    header = {
+        "channels": list(channels),
+        "num_rows": int(block.shape[0]),
+        "time": {"offset": 0, "dtype": "<f8", "length": int(times.shape[0])},
+        "signals": {"offset": int(times.nbytes), "dtype": "<f4", "shape": list(block.shape), "layout": "row-major"},
+        **header_fields,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(4 + len(header_bytes)) % 8)
+    return b"".join([struct.pack("<I", len(header_bytes)), header_bytes, times.tobytes(), block.tobytes()])
+
+
+def encode_arrow(times, block, channels, **metadata):
+    """Arrow IPC stream: a float64 'time' column plus one float32 column per channel."""
+    import pyarrow as pa
+
+    block = np.asarray(block, dtype=np.float32)
+    columns = [pa.array(np.asarray(times, dtype=np.float64))]
+    columns += [pa.array(block[:, i]) for i in range(block.shape[1])]
+    schema_metadata = {k: json.dumps(v) for k, v in metadata.items()}
+    table = pa.Table.from_arrays(columns, names=["time"] + list(channels), metadata=schema_metadata)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
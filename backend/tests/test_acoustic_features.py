@@ -0,0 +1,42 @@
+import librosa
+import numpy as np
+import pytest
+
+from app.Acoustic_Signals.services.audio_features import N_MELS, N_MFCC, AcousticFeatures
+
+SR = 16000
+
+
+def reference_features(y, sr):
+    """The separate librosa calls the detector made per window: (feature row, spectrogram)."""
+    mfcc = np.mean(librosa.feature.mfcc(y=y, sr=sr, n_mfcc=N_MFCC).T, axis=0)
+    centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr).T, axis=0)
+    zcr = np.mean(librosa.feature.zero_crossing_rate(y).T, axis=0)
+    rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr).T, axis=0)
+
+    spec = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=N_MELS)
+    spec_db = librosa.power_to_db(spec, ref=np.max)
+    spec_db = (spec_db - spec_db.min()) / (spec_db.max() - spec_db.min() + 1e-6)
+    return np.hstack([mfcc, centroid, zcr, rolloff]), spec_db.astype(np.float32)
+
+
+@pytest.fixture
+def windows():
+    # Differently scaled windows in one batch: each must be scored as if it were alone
+    rng = np.random.default_rng(0)
+    t = np.arange(4 * SR) / SR
+    return np.stack([
+        0.5 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t)),
+        0.01 * rng.standard_normal(len(t)),
+        np.zeros(len(t)),
+    ]).astype(np.float32)
+
+
+def test_shared_stft_matches_separate_librosa_calls(windows):
+    features = AcousticFeatures(windows, SR)
+    rows, specs = features.ml_features(), features.spectrogram()
+    assert rows.shape == (len(windows), N_MFCC + 3)
+    for k, y in enumerate(windows):
+        ref_row, ref_spec = reference_features(y, SR)
+        np.testing.assert_allclose(rows[k], ref_row, rtol=1e-4, atol=1e-3)
+        np.testing.assert_allclose(specs[k, 0], ref_spec, atol=1e-4)
@@ -0,0 +1,44 @@
+import numpy as np
+from scipy import stats
+
+from app.ECG.services.cnn_inference import WINDOW_SIZE
+from app.ECG.services.service import extract_feature_matrix
+
+
+def reference_features(signal):
+    """The per-window extraction the classical forest was trained on."""
+    signal = np.asarray(signal, dtype=np.float32)
+    q25 = np.percentile(signal, 25)
+    q75 = np.percentile(signal, 75)
+    fft_vals = np.abs(np.fft.fft(signal))
+    fft_vals = fft_vals[: len(fft_vals) // 2]
+
+    features = [
+        np.mean(signal),
+        np.std(signal),
+        np.max(signal),
+        np.min(signal),
+        np.ptp(signal),
+        np.median(signal),
+        q25,
+        q75,
+        stats.skew(signal),
+        stats.kurtosis(signal),
+        np.var(signal),
+        np.sqrt(np.mean(signal**2)),
+        np.sum(np.abs(np.diff(signal))),
+        np.sum(fft_vals),
+        np.argmax(fft_vals),
+    ]
+    return np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0).tolist()
+
+
+def test_feature_matrix_is_bit_identical_to_per_window_extraction():
+    windows = np.random.default_rng(0).standard_normal((64, WINDOW_SIZE)).astype(np.float32) * 100
+    windows[1] = 3.0                 # flat window
+    windows[2, 50] = np.nan          # gap
+    windows[3] *= 1e-4               # near-silent lead
+
+    batched = extract_feature_matrix(windows)
+    reference = np.array([reference_features(window) for window in windows])
+    np.testing.assert_array_equal(batched, reference)
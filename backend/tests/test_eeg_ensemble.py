@@ -0,0 +1,56 @@
+import numpy as np
+import xgboost as xgb
+
+from app.EEG.services.ensemble import XGBFoldEnsemble
+
+N_FEATURES = 12
+N_CLASSES = 6
+
+
+def reference_predict(boosters, features):
+    """The fold-by-fold, row-by-row loop the fused ensemble replaces."""
+    features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+    rows = []
+    for row in features:
+        total = 0.0
+        for booster in boosters:
+            pred = booster.predict(xgb.DMatrix(row[np.newaxis])).reshape(1, -1)
+            pred = np.clip(pred, 1e-15, 1.0)
+            total = total + pred / np.sum(pred, axis=1, keepdims=True)
+        rows.append(total[0] / len(boosters))
+    return np.array(rows)
+
+
+def _fold_models(tmp_path, n_folds=3):
+    rng = np.random.default_rng(0)
+    paths = []
+    for fold in range(n_folds):
+        x = rng.standard_normal((300, N_FEATURES)).astype(np.float32)
+        y = (np.abs(x[:, fold]) * 2 + (x[:, 3] > 0)).astype(int) % N_CLASSES
+        booster = xgb.train(
+            {"objective": "multi:softprob", "num_class": N_CLASSES, "max_depth": 3, "seed": fold},
+            xgb.DMatrix(x, label=y), num_boost_round=10,
+        )
+        path = tmp_path / f"xgb_model_foldFinal_{fold}.json"
+        booster.save_model(str(path))
+        paths.append(str(path))
+    return paths
+
+
+def test_fused_ensemble_matches_per_model_loop(tmp_path):
+    paths = _fold_models(tmp_path)
+    # Missing fold files are skipped, as with a partial model directory
+    ensemble = XGBFoldEnsemble(paths + [str(tmp_path / "missing.json")])
+    assert len(ensemble) == len(paths)
+
+    features = np.random.default_rng(1).standard_normal((16, N_FEATURES))
+    fused = ensemble.predict(features)
+    assert fused.shape == (16, N_CLASSES)
+    np.testing.assert_allclose(fused, reference_predict(ensemble.boosters, features), rtol=0, atol=1e-6)
+    np.testing.assert_allclose(fused.sum(axis=1), 1.0, atol=1e-6)
+
+
+def test_single_row_is_promoted_to_a_batch(tmp_path):
+    ensemble = XGBFoldEnsemble(_fold_models(tmp_path, n_folds=2))
+    row = np.random.default_rng(2).standard_normal(N_FEATURES)
+    np.testing.assert_allclose(ensemble.predict(row), ensemble.predict(row[np.newaxis]))
@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+
+from app.EEG.services.dl_feature_logic import FEATS, create_spectrogram_from_eeg
+
+
+def test_montage_uses_channel_names_not_column_order():
+    rng = np.random.default_rng(0)
+    eeg = pd.DataFrame(rng.standard_normal((3000, len(FEATS))), columns=FEATS)
+
+    # EDF-style upload: TUH electrode order plus a channel the montage does not use
+    shuffled = eeg[list(reversed(FEATS))].copy()
+    shuffled.insert(3, "Photic", rng.standard_normal(len(eeg)))
+
+    np.testing.assert_allclose(create_spectrogram_from_eeg(shuffled), create_spectrogram_from_eeg(eeg))
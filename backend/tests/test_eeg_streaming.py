@@ -0,0 +1,63 @@
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.EEG.services.extract_info import FeatureExtractor
+from app.EEG.services.session_store import SessionStore
+
+FS = 200
+CHANNELS = ["Fp1", "F3", "C3"]
+
+
+def _recording(seconds=20, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * FS) / FS
+    data = np.stack([
+        50 * np.sin(2 * np.pi * 10 * t),
+        30 * np.sin(2 * np.pi * 6 * t) + 5,
+        20 * rng.standard_normal(len(t)),
+    ], axis=1)
+    return pd.DataFrame(data, columns=CHANNELS)
+
+
+def _ingest(tmp_path, df, chunk_rows):
+    store = SessionStore(str(tmp_path / "sessions"))
+    file_id = str(uuid.uuid4())
+
+    def open_chunks():
+        return (df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows))
+
+    metadata, rate, quality, raw = FeatureExtractor().extract_stream(open_chunks, store, file_id, raw_span_sec=5)
+    return store, file_id, metadata, rate, quality, raw
+
+
+def test_extract_stream_stores_filtered_session(tmp_path):
+    df = _recording()
+    store, file_id, metadata, rate, quality, raw = _ingest(tmp_path, df, chunk_rows=700)
+
+    assert metadata["channels"] == CHANNELS
+    assert metadata["num_samples"] == len(df)
+    assert rate == FS
+    signals = store.open_signals(file_id)
+    assert signals.shape == (len(df), len(CHANNELS))
+    assert np.isfinite(signals).all()
+    # The 0.5-40 Hz band-pass keeps the 10 Hz sine and removes the DC offset
+    settled = np.asarray(signals[5 * FS:])
+    assert 40 < np.abs(settled[:, 0]).max() < 60
+    assert abs(settled[:, 1].mean()) < 1
+    assert quality.finish().shape == (len(df) // FS, len(CHANNELS))
+    # The predictor gets the raw rows of the middle 5 s, as the default path would see them
+    first_row, raw_rows = raw
+    assert first_row == (len(df) - 5 * FS) // 2
+    np.testing.assert_array_equal(raw_rows.to_numpy(), df.iloc[first_row:first_row + 5 * FS].to_numpy())
+
+
+def test_extract_stream_does_not_depend_on_chunking(tmp_path):
+    df = _recording()
+    store_a, id_a, _, _, quality_a, raw_a = _ingest(tmp_path / "a", df, chunk_rows=333)
+    store_b, id_b, _, _, quality_b, raw_b = _ingest(tmp_path / "b", df, chunk_rows=len(df))
+
+    np.testing.assert_allclose(store_a.open_signals(id_a), store_b.open_signals(id_b), atol=1e-4)
+    np.testing.assert_array_equal(quality_a.finish(), quality_b.finish())
+    np.testing.assert_array_equal(raw_a[1].to_numpy(), raw_b[1].to_numpy())
@@ -0,0 +1,22 @@
+import time
+import uuid
+
+import numpy as np
+
+from app.EEG.services.quality import load_quality, save_quality
+from app.EEG.services.session_store import SessionStore
+
+
+def test_oversized_new_session_survives_quota_sweep_until_grace_expires(tmp_path):
+    store = SessionStore(str(tmp_path), max_bytes=1024, grace_seconds=60)
+    file_id = str(uuid.uuid4())
+    store.save(file_id, np.ones((2000, 2), dtype=np.float32), ["a", "b"], 200)
+
+    # The request that created it can still attach its quality mask
+    store.sweep()
+    save_quality(store, file_id, np.zeros((10, 2), dtype=np.uint8), 1.0)
+    info, mask = load_quality(store, file_id, 2)
+    assert mask.shape == (10, 2)
+
+    store.sweep(now=time.time() + 120)
+    assert not store.exists(file_id)
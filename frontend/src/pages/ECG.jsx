@@ -52,16 +52,36 @@ export default function ECG() {
     }
   };
 
+  const handleFileChange = (e) => {
+    setFile(e.target.files[0]);
+    // The stored record belongs to the previous file
+    setResult(null);
+    setPrediction(null);
+  };
+
+  const postPredict = (model, recordId) => {
+    const formData = new FormData();
+    if (recordId) formData.append("record_id", recordId);
+    else formData.append("file", file);
+    formData.append("model", model);
+    return axios.post("http://localhost:8000/ecg/predict", formData, {
+      headers: { "Content-Type": "multipart/form-data" },
+    });
+  };
+
   const handlePredict = async (model) => {
     if (!file) return alert("Please upload a file first");
-    const formData = new FormData();
-    formData.append("file", file);
-    formData.append("model", model);  
     try {
       setPredictLoading(true);
-      const res = await axios.post("http://localhost:8000/ecg/predict", formData, {
-        headers: { "Content-Type": "multipart/form-data" },
-      });
+      let res;
+      try {
+        // Reuse the record stored by /ecg/upload instead of sending the file again
+        res = await postPredict(model, result?.record_id);
+      } catch (err) {
+        // The stored record expired: send the file itself
+        if (!result?.record_id || err?.response?.status !== 404) throw err;
+        res = await postPredict(model, null);
+      }
       setPrediction(res.data.prediction);
     } catch (err) {
       console.error("Prediction error:", err);
@@ -195,7 +215,7 @@ export default function ECG() {
           <input
             type="file"
             accept=".csv,.zip"
-            onChange={(e) => setFile(e.target.files[0])}
+            onChange={handleFileChange}
           />
           <button onClick={handleUpload} disabled={loading}>
             {loading ? "Processing..." : "Upload & Analyze"}